@@ -6,17 +6,23 @@ from enhanced_metrics import (
     calculate_state_performance,
     calculate_district_performance,
     get_age_distribution_by_state,
-    calculate_population_coverage,
-    calculate_adult_enrollment_by_state
+    get_coverage_extremes,
+    calculate_adult_enrollment_by_state,
+    fit_birth_regression,
+    get_priority_zones,
+    calculate_rolling_velocity
 )
+from cube import rollup, totals
+from instrumentation import instrumented
 
+@instrumented
 def enrollment_trend(enrol):
     """Line chart showing daily enrollment volume across age groups"""
     # Ensure date is datetime
-    if not pd.api.types.is_datetime64_any_dtype(enrol['date']):
+    if isinstance(enrol, pd.DataFrame) and not pd.api.types.is_datetime64_any_dtype(enrol['date']):
         enrol['date'] = pd.to_datetime(enrol['date'], format='%d-%m-%Y')
     
-    trend = enrol.groupby('date')[['age_0_5','age_5_17','age_18_greater']].sum().reset_index()
+    trend = rollup(enrol, 'daily')[['date','age_0_5','age_5_17','age_18_greater']]
     fig = px.line(trend, x='date', y=['age_0_5','age_5_17','age_18_greater'],
                   title="Daily Enrollment Trend (New 2025 Enrollments)",
                   labels={"value": "Count", "date": "Date", "variable": "Age Group"},
@@ -24,9 +30,10 @@ def enrollment_trend(enrol):
     fig.update_layout(hovermode="x unified")
     return fig
 
-def monthly_velocity_chart(enrol):
-    """Bar chart showing enrollment volume per month"""
-    velocity_data = calculate_enrollment_velocity(enrol)
+@instrumented
+def monthly_velocity_chart(enrol, start=None, end=None):
+    """Bar chart showing enrollment volume per month (over the [start, end] window if given)"""
+    velocity_data = calculate_enrollment_velocity(enrol, start, end)
     monthly = velocity_data['monthly']
     
     fig = px.bar(monthly, x='month_name', y='total_enrollments',
@@ -35,13 +42,14 @@ def monthly_velocity_chart(enrol):
                  text_auto='.2s',
                  color='total_enrollments',
                  color_continuous_scale='Viridis')
-    fig.update_layout(xaxis={'categoryorder':'array', 'categoryarray':['March','April','May','June','July','August','September','October','November','December']})
+    # Months in calendar order, whatever period the data covers
+    fig.update_layout(xaxis={'categoryorder':'array', 'categoryarray':list(dict.fromkeys(monthly['month_name']))})
     return fig
 
+@instrumented
 def state_performance_ranking(enrol):
     """Horizontal bar chart showing enrollments per district (Normalized Performance)"""
-    state_perf = calculate_state_performance(enrol)
-    top_states = state_perf.head(15)
+    top_states = calculate_state_performance(enrol, top_n=15)
     
     fig = px.bar(top_states, 
                  y='state', x='enrollments_per_district',
@@ -53,9 +61,10 @@ def state_performance_ranking(enrol):
     fig.update_layout(yaxis={'categoryorder':'total ascending'})
     return fig
 
+@instrumented
 def district_leaderboard(enrol):
     """Bar chart for top 20 districts nationally"""
-    dist_perf = calculate_district_performance(enrol).head(20)
+    dist_perf = calculate_district_performance(enrol, top_n=20)
     
     fig = px.bar(dist_perf, 
                  x='district', y='total_enrollments',
@@ -67,12 +76,13 @@ def district_leaderboard(enrol):
     fig.update_layout(xaxis={'categoryorder':'total descending'})
     return fig
 
-def age_group_composition(enrol):
+@instrumented
+def age_group_composition(enrol, start=None, end=None):
     """Stacked bar chart showing age group distribution by state"""
-    age_dist = get_age_distribution_by_state(enrol)
+    age_dist = get_age_distribution_by_state(enrol, start, end)
     
     # Calculate totals for sorting
-    totals = age_dist.groupby('state')['enrollments'].sum().reset_index()
+    totals = age_dist.groupby('state', observed=True)['enrollments'].sum().reset_index()
     top_states = totals.sort_values('enrollments', ascending=False).head(15)['state'].tolist()
     age_dist_top = age_dist[age_dist['state'].isin(top_states)]
     
@@ -88,9 +98,10 @@ def age_group_composition(enrol):
     fig.update_layout(xaxis={'categoryorder':'total descending'})
     return fig
 
-def age_distribution(enrol):
-    """Pie chart for global age group distribution"""
-    age_sum = enrol[['age_0_5','age_5_17','age_18_greater']].sum().reset_index()
+@instrumented
+def age_distribution(enrol, start=None, end=None):
+    """Pie chart for global age group distribution (over the [start, end] window if given)"""
+    age_sum = totals(enrol, start, end)[['age_0_5','age_5_17','age_18_greater']].reset_index()
     age_sum.columns = ['Age Group', 'Total']
     fig = px.pie(age_sum, names='Age Group', values='Total', 
                  title="National Age Group Distribution (New Enrollments)",
@@ -98,9 +109,10 @@ def age_distribution(enrol):
                  color_discrete_sequence=px.colors.qualitative.Pastel)
     return fig
 
+@instrumented
 def state_wise_enrollment(enrol):
     """Bar chart for total enrollment by state"""
-    state_data = enrol.groupby('state')[['age_0_5', 'age_5_17', 'age_18_greater']].sum().reset_index()
+    state_data = rollup(enrol, 'state')[['state', 'age_0_5', 'age_5_17', 'age_18_greater']].copy()
     state_data['total'] = state_data['age_0_5'] + state_data['age_5_17'] + state_data['age_18_greater']
     
     fig = px.bar(state_data.sort_values('total', ascending=False).head(15),
@@ -111,14 +123,12 @@ def state_wise_enrollment(enrol):
                  color_continuous_scale='Reds')
     return fig
 
+@instrumented
 def enrollment_vs_birth_scatter(enrol, birth_df):
     """Scatter plot: New Child Enrollments vs Total Births"""
-    # Total enrollment per state
-    enrol_state = enrol.groupby('state')[['age_0_5']].sum().reset_index()
-    enrol_state.columns = ['state', 'enrolled_0_5']
-
-    # Merge with birth data
-    df = pd.merge(birth_df, enrol_state, on='state', how='inner')
+    # Per-state points and the OLS fit, computed in closed form
+    fit = fit_birth_regression(enrol, birth_df)
+    df = fit['points']
 
     # Scatter plot
     fig = px.scatter(
@@ -131,19 +141,23 @@ def enrollment_vs_birth_scatter(enrol, birth_df):
             "total_births": "Annual Registered Births (Base Capacity)",
             "enrolled_0_5": "Actual New Child Enrollments (UIDAI)"
         },
-        trendline="ols"
+        hover_data={'residual': ':,.0f'}
     )
 
     fig.update_traces(textposition='top center')
+    if not np.isnan(fit['slope']):
+        x = np.array([df['total_births'].min(), df['total_births'].max()])
+        fig.add_scatter(
+            x=x, y=fit['intercept'] + fit['slope'] * x, mode='lines',
+            name=f"OLS trend (R² = {fit['r_squared']:.2f})"
+        )
     return fig
 
+@instrumented
 def coverage_gap_analysis(enrol, birth_df):
     """Bar chart: Gap between expected birth capacity and actual 2025 enrollments"""
-    from utils import normalize_state_names
-    enrol = normalize_state_names(enrol.copy())
-    birth_df = normalize_state_names(birth_df.copy())
-
-    state_totals = enrol.groupby('state', as_index=False).agg({'age_0_5': 'sum'})
+    # State names are canonical in both frames since ingest
+    state_totals = rollup(enrol, 'state')[['state', 'age_0_5']].copy()
     state_totals.rename(columns={'age_0_5': 'enrolled_0_5'}, inplace=True)
 
     df = pd.merge(birth_df, state_totals, on='state', how='left')
@@ -168,13 +182,7 @@ def coverage_gap_analysis(enrol, birth_df):
     return fig, worst
 
 
-def population_coverage_chart(enrol, pop_df):
-    """Horizontal bar chart showing enrollment / population ratio (Top States)"""
-    coverage_data = calculate_population_coverage(enrol, pop_df)
-    
-    # Take top 15 for the chart
-    top_coverage = coverage_data.head(15)
-    
+def _leaders_figure(top_coverage):
     fig = px.bar(top_coverage, 
                  y='state', x='enrollments_per_100k',
                  title="Performance Leaders: Enrollment Density (New Enrollments per 100k Population)",
@@ -191,13 +199,7 @@ def population_coverage_chart(enrol, pop_df):
     return fig
 
 
-def bottom_population_coverage_chart(enrol, pop_df):
-    """Horizontal bar chart showing enrollment / population ratio (Bottom States)"""
-    coverage_data = calculate_population_coverage(enrol, pop_df)
-    
-    # Take bottom 15 for the chart (excluding ones with 0 if they clutter)
-    bottom_coverage = coverage_data.tail(15)
-    
+def _laggards_figure(bottom_coverage):
     fig = px.bar(bottom_coverage, 
                  y='state', x='enrollments_per_100k',
                  title="Performance Laggards: Enrollment Density (Lowest Enrollments per 100k Population)",
@@ -214,9 +216,33 @@ def bottom_population_coverage_chart(enrol, pop_df):
     return fig
 
 
-def adult_enrollment_by_state_chart(enrol):
+@instrumented
+def population_coverage_chart(enrol, pop_df):
+    """Horizontal bar chart showing enrollment / population ratio (Top States)"""
+    # Take top 15 for the chart
+    top_coverage, _ = get_coverage_extremes(enrol, pop_df, 15)
+    return _leaders_figure(top_coverage)
+
+
+@instrumented
+def bottom_population_coverage_chart(enrol, pop_df):
+    """Horizontal bar chart showing enrollment / population ratio (Bottom States)"""
+    # Take bottom 15 for the chart (excluding ones with 0 if they clutter)
+    _, bottom_coverage = get_coverage_extremes(enrol, pop_df, 15)
+    return _laggards_figure(bottom_coverage)
+
+
+@instrumented
+def coverage_extremes_charts(enrol, pop_df, n=15, start=None, end=None):
+    """Leaders and laggards charts built from a single coverage computation"""
+    top_coverage, bottom_coverage = get_coverage_extremes(enrol, pop_df, n, start, end)
+    return _leaders_figure(top_coverage), _laggards_figure(bottom_coverage)
+
+
+@instrumented
+def adult_enrollment_by_state_chart(enrol, start=None, end=None):
     """Bar chart showing total adult enrollment by state"""
-    adult_data = calculate_adult_enrollment_by_state(enrol).head(15)
+    adult_data = calculate_adult_enrollment_by_state(enrol, start, end).head(15)
     
     fig = px.bar(adult_data, 
                  x='state', y='age_18_greater',
@@ -226,3 +252,36 @@ def adult_enrollment_by_state_chart(enrol):
                  color_continuous_scale='Purples')
     fig.update_layout(xaxis={'categoryorder':'total descending'})
     return fig
+
+
+@instrumented
+def priority_zones_table(enrol, birth_df, n=10):
+    """Table of the states furthest below the births trend line, rounded for display"""
+    priority = get_priority_zones(enrol, birth_df, n)
+    columns = ['state', 'total_births', 'enrolled_0_5', 'predicted', 'residual', 'residual_pct']
+    return priority[columns].round({'predicted': 0, 'residual': 0})
+
+
+@instrumented
+def rolling_velocity_chart(enrol, threshold=3.0):
+    """Line chart of daily enrollments with 7- and 28-day rolling velocity, spikes and drops marked"""
+    rolling = calculate_rolling_velocity(enrol, 'national', threshold=threshold)
+
+    fig = px.line(rolling['velocity'], x='date', y=['total_enrollments', 'velocity_7d', 'velocity_28d'],
+                  title="Rolling Enrollment Velocity (7 / 28-day) with Spikes and Drops",
+                  labels={"value": "Enrollments per Day", "date": "Date", "variable": "Series"},
+                  color_discrete_sequence=['#c7c7c7', '#1f77b4', '#ff7f0e'])
+    anomalies = rolling['anomalies']
+    for kind, color, symbol in [('spike', '#2ca02c', 'triangle-up'), ('drop', '#d62728', 'triangle-down')]:
+        points = anomalies[anomalies['kind'] == kind]
+        fig.add_scatter(x=points['date'], y=points['total_enrollments'], mode='markers',
+                        marker={'color': color, 'size': 11, 'symbol': symbol}, name=f"{kind.title()} (|z| ≥ {threshold:g})")
+    fig.update_layout(hovermode="x unified")
+    return fig
+
+
+@instrumented
+def district_anomalies_table(enrol, n=20, threshold=3.0):
+    """Table of the strongest district-level enrollment spikes and drops, rounded for display"""
+    anomalies = calculate_rolling_velocity(enrol, 'district', threshold=threshold)['anomalies'].head(n)
+    return anomalies.assign(date=anomalies['date'].dt.strftime('%Y-%m-%d')).round({'baseline': 0, 'z_score': 1})
@@ -0,0 +1,184 @@
+"""
+Enrollment Metrics JSON API
+
+Serves the dashboard's headline metrics to other systems:
+
+    GET /api/summary      get_summary_statistics
+    GET /api/states       calculate_state_performance      (?limit=)
+    GET /api/districts    calculate_district_performance   (?limit=)
+    GET /api/coverage     calculate_population_coverage
+    GET /api/pincodes     get_top_pincodes                  (?limit=, default 50)
+    GET /api/version      current data version and background refresh status
+    GET /api/charts/<name>  a chart of the batch snapshot as plotly JSON (?state=)
+
+Every metric endpoint accepts `state` and an inclusive `start` / `end` date
+window (YYYY-MM-DD); an unknown state is a 404. Responses are cached in a
+least-recently-used cache bounded by UIDAI_RESPONSE_CACHE_MB of response
+bodies, per data version and parameters, and carry an ETag derived from both, so a poller sending
+If-None-Match gets a 304 without pandas being touched. Full-period
+summaries and charts are served from the batch snapshot of the current
+version (see snapshots.py) when there is one; pandas and the metric
+modules are only imported once a response has to be computed. From then
+on a background thread keeps the newest data version loaded (see
+refresher.py), so requests never wait for a reload: they are answered from
+the version loaded so far and labelled with it.
+
+    python api.py   # or: flask --app api run
+"""
+
+import hashlib
+import importlib
+import json
+import os
+
+from flask import Flask, Response, jsonify, request
+
+from figure_cache import FigureCache
+from refresher import DataRefresher
+from snapshots import ALL, open_snapshot
+from versions import current_version
+
+RESPONSE_CACHE_MB_ENV = "UIDAI_RESPONSE_CACHE_MB"
+DEFAULT_RESPONSE_CACHE_MB = 64
+
+app = Flask(__name__)
+
+_responses = FigureCache(int(float(os.environ.get(RESPONSE_CACHE_MB_ENV, DEFAULT_RESPONSE_CACHE_MB)) * 1e6), size=len)
+
+
+def _load_data():
+    from store import load_current_cube
+    from utils import load_population_data
+
+    cube = load_current_cube()
+    # Warmed here, off the request path
+    cube.time_index
+    return cube.version, (cube, load_population_data())
+
+
+# Entries of older versions can never be served again
+_refresher = DataRefresher(_load_data, on_swap=lambda loaded: _responses.clear())
+
+
+def _current_cube():
+    """The cube and population of the newest loaded data version; the first call starts the refresher"""
+    return _refresher.start().current().data
+
+
+def _frame_json(df, limit=None):
+    if limit is not None:
+        df = df.head(limit)
+    return df.to_json(orient='records', date_format='iso')
+
+
+def _metrics():
+    return importlib.import_module('enhanced_metrics')
+
+
+ENDPOINTS = {
+    'states': lambda cube, pop_df, limit: _frame_json(_metrics().calculate_state_performance(cube, top_n=limit)),
+    'districts': lambda cube, pop_df, limit: _frame_json(
+        _metrics().calculate_district_performance(cube, top_n=limit)
+    ),
+    'pincodes': lambda cube, pop_df, limit: _frame_json(_metrics().get_top_pincodes(cube, top_n=limit or 50)),
+}
+
+# Endpoints answering the date window from the cube's prefix-sum time index
+# instead of from a cube filtered to it
+WINDOWED_ENDPOINTS = {
+    'summary': lambda cube, pop_df, limit, start, end: json.dumps(
+        _metrics().get_summary_statistics(cube, start, end), default=int
+    ),
+    'coverage': lambda cube, pop_df, limit, start, end: _frame_json(
+        _metrics().calculate_population_coverage(cube, pop_df, start, end), limit
+    ),
+}
+
+
+def _parse_params():
+    """Validated filter parameters as a canonical tuple (raises ValueError)"""
+    state = request.args.get('state') or None
+    start = request.args.get('start')
+    end = request.args.get('end')
+    limit = request.args.get('limit')
+    if start or end:
+        import pandas as pd
+
+        start = pd.Timestamp(start).date().isoformat() if start else None
+        end = pd.Timestamp(end).date().isoformat() if end else None
+    else:
+        start = end = None
+    limit = int(limit) if limit else None
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be positive")
+    return state, start, end, limit
+
+
+def _etag(version, endpoint, params):
+    key = json.dumps([version, endpoint, params])
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+@app.route('/api/<endpoint>')
+def metrics(endpoint):
+    if endpoint == 'version':
+        return jsonify(version=current_version(), refresh=_refresher.status(), cache=_responses.stats())
+    if endpoint not in ENDPOINTS and endpoint not in WINDOWED_ENDPOINTS:
+        return jsonify(error=f"unknown endpoint '{endpoint}'"), 404
+    try:
+        params = _parse_params()
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+
+    version = current_version()
+    etag = _etag(version, endpoint, params)
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+    body = _responses.get(etag)
+    if body is None and endpoint == 'summary' and params[1:3] == (None, None):
+        snapshot = open_snapshot(version)
+        region = params[0] or ALL
+        if snapshot is not None and snapshot.has(region):
+            body = snapshot.summary_json(region)
+    if body is None:
+        cube, pop_df = _current_cube()
+        if cube.version != version:
+            # The data moved on since the version check; label what we serve
+            version = cube.version
+            etag = _etag(version, endpoint, params)
+        state, start, end, limit = params
+        if state not in (None, ALL) and state not in cube.regions.state_ranges:
+            return jsonify(error=f"unknown state '{state}'"), 404
+        if endpoint in WINDOWED_ENDPOINTS:
+            body = WINDOWED_ENDPOINTS[endpoint](cube.filter(state), pop_df, limit, start, end)
+        else:
+            body = ENDPOINTS[endpoint](cube.filter(state, start, end), pop_df, limit)
+        _responses.put(etag, body)
+
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['X-Data-Version'] = version
+    return response
+
+
+@app.route('/api/charts/<name>')
+def chart(name):
+    """A chart of the current version's batch snapshot; 404 when it has none"""
+    version = current_version()
+    region = request.args.get('state') or ALL
+    etag = _etag(version, f"charts/{name}", [region])
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    snapshot = open_snapshot(version)
+    if snapshot is None or not snapshot.has(region, name):
+        return jsonify(error=f"no snapshot of chart '{name}' for {region} at version {version}"), 404
+
+    response = Response(snapshot.chart_json(region, name), mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['X-Data-Version'] = version
+    return response
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=5000)
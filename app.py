@@ -1,84 +1,319 @@
+import time
+
+# Startup clock: taken before any other import so the report covers them
+APP_START = time.perf_counter()
+
+import functools
+import importlib
+import json
+import sys
+
 import streamlit as st
-from utils import load_data, load_birth_data, load_population_data
-from enhanced_metrics import get_summary_statistics
-from analysis import (
-    age_distribution,
-    enrollment_trend,
-    state_wise_enrollment,
-    monthly_velocity_chart,
-    age_group_composition,
-    enrollment_vs_birth_scatter,
-    population_coverage_chart,
-    bottom_population_coverage_chart,
-    adult_enrollment_by_state_chart
-)
+from figure_cache import figure_cache
+from instrumentation import enabled_by_env, finish_rerun, start_rerun, timed_block
+from refresher import DataRefresher
+from snapshots import ALL, open_snapshot
+from versions import current_version, read_summary, write_summary
 
 st.set_page_config(layout="wide", page_title="UIDAI 2025 Enrollment Insights")
 
-# Load Data
-enrol, _, _ = load_data()
-birth_df = load_birth_data()
-pop_df = load_population_data()
-
-# --- HEADER SECTION ---
-st.title("📊 UIDAI 2025 Enrollment Analytics")
-st.markdown("### *Focusing on New Enrollment Velocity and Regional Performance*")
-
-# Summary Metrics
-stats = get_summary_statistics(enrol)
-col1, col2, col3, col4 = st.columns(4)
-with col1:
-    st.metric("Total 2025 Enrollments", f"{stats['total_enrollments']:,}")
-with col2:
-    st.metric("Avg Daily Velocity", f"{stats['avg_daily_enrollments']:,}/day")
-with col3:
-    st.metric("Primary Focus (Age 0-5)", f"{stats['age_0_5']:,}")
-with col4:
-    st.metric("Active Regions", f"{stats['num_districts']:,} Districts")
-
-# --- SIDEBAR FILTERS ---
-st.sidebar.header("🔍 Filters")
-state_list = ["All"] + sorted(enrol['state'].dropna().unique().tolist())
-selected_state = st.sidebar.selectbox("Select State", state_list)
-
-filtered_enrol = enrol
-if selected_state != "All":
-    filtered_enrol = enrol[enrol['state'] == selected_state]
-
-# --- MAIN DASHBOARD ---
-tab1, tab2, tab3 = st.tabs(["📊 Performance Leaderboards", "🍼 Birth & Child Stats", "📅 Monthly Pulse"])
-
-with tab1:
-    st.subheader("Enrollment Density: Performance Leaders")
-    st.plotly_chart(population_coverage_chart(enrol, pop_df), use_container_width=True)
-    st.info("💡 High density indicates effective outreach relative to the total population baseline.")
-
-    st.subheader("Enrollment Density: Performance Laggards")
-    st.plotly_chart(bottom_population_coverage_chart(enrol, pop_df), use_container_width=True)
-    st.warning("⚠️ These regions may require targeted registration awareness programs.")
-
-    st.subheader("Adult Enrollment Leaderboard (18+)")
-    st.plotly_chart(adult_enrollment_by_state_chart(enrol), use_container_width=True)
-
-    st.subheader("Regional Age Distribution Focus (Top 15 States)")
-    st.plotly_chart(age_group_composition(enrol), use_container_width=True)
-
-with tab2:
-    st.subheader("Child Enrollment (Age 0-5) Velocity vs Birth Capacity")
-    st.plotly_chart(enrollment_vs_birth_scatter(filtered_enrol, birth_df), use_container_width=True)
-    
-    st.success("""
-    **Analytical Note:** The scatter plot compares **Actual 2025 Momentum** against **State Birth Capacity**. 
-    States falling significantly below the trend line (regression line) are priority zones for newborn enrollment.
-    """)
-
-with tab3:
-    st.subheader("Monthly Enrollment Velocity (2025)")
-    st.plotly_chart(monthly_velocity_chart(filtered_enrol), use_container_width=True)
-    
-    st.subheader("National Age Group Breakdown")
-    st.plotly_chart(age_distribution(filtered_enrol), use_container_width=True)
-    st.info("Peaks in the monthly velocity often correspond to government enrollment drives or school registration cycles.")
-
-st.markdown("---")
-st.caption(f"Data Source: enrolment_merged_cleaned.csv | Covering period: {stats['date_range']}")
+# Opt-in timing of this rerun: UIDAI_INSTRUMENT=1 or ?debug=1 in the URL
+instrumenting = enabled_by_env() or st.query_params.get("debug") == "1"
+
+# Seconds since APP_START at each startup milestone of this rerun
+startup = {'streamlit ready': time.perf_counter() - APP_START}
+
+
+def lazy(module):
+    """
+    Imports a heavy module (pandas, plotly and the data modules behind it)
+    the first time something needs it, recording the import time
+    """
+    if module not in sys.modules:
+        began = time.perf_counter()
+        importlib.import_module(module)
+        startup[f"import {module}"] = time.perf_counter() - began
+    return sys.modules[module]
+
+
+def render_chart(fig):
+    """Draws a figure; serialization is timed as its own block when instrumenting"""
+    with timed_block(f"plotly_chart: {fig.layout.title.text}"):
+        st.plotly_chart(fig, use_container_width=True)
+
+
+def load_data():
+    """
+    Loads the cube of the current data version and warms what every session
+    reads first, on the refresher's thread instead of in a session
+    """
+    cube = importlib.import_module('store').load_current_cube()
+    # Builds the region index too
+    cube.time_index
+    write_summary(cube.version, importlib.import_module('enhanced_metrics').get_summary_statistics(cube))
+    return cube.version, cube
+
+
+@st.cache_resource(show_spinner=False)
+def data_refresher():
+    """
+    The process-wide refresher, swapping in each new data version once it
+    has loaded; its thread is started at the end of a rerun (see below)
+    """
+    return DataRefresher(load_data)
+
+
+@st.cache_data
+def load_births():
+    return lazy('utils').load_birth_data()
+
+
+@st.cache_data
+def load_population():
+    return lazy('utils').load_population_data()
+
+
+@st.cache_data(max_entries=64)
+def summary_statistics(version, start, end, _cube):
+    """Header metrics of one data version and date window (the cube itself is not hashed)"""
+    return lazy('enhanced_metrics').get_summary_statistics(_cube, start, end)
+
+
+@functools.cache
+def current_cube():
+    """The cube of this rerun's data version; waits only while no version has loaded yet"""
+    with st.spinner("Loading enrolment data..."):
+        loaded = pinned or refresher.current()
+    startup['data loaded'] = time.perf_counter() - APP_START
+    return loaded.data
+
+
+def memo_figure(name, region, build):
+    """
+    Figure (or table) `name` from the process-wide figure cache, built only
+    when no session has built it for this data version, date window and
+    `region` (None for national figures) yet. Over the full period, a
+    batch snapshot of this version (see snapshots.py) replaces the build.
+    """
+    if snapshot is not None and start is None and end is None:
+        state, district = region or (ALL, ALL)
+        if district == ALL and snapshot.has(state, name):
+            build = functools.partial(snapshot.chart, state, name)
+    return figure_cache.get_or_build((name, region, start, end, data_version), build)
+
+
+def render_header(stats):
+    with header.container():
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Total 2025 Enrollments", f"{stats['total_enrollments']:,}")
+        with col2:
+            st.metric("Avg Daily Velocity", f"{stats['avg_daily_enrollments']:,}/day")
+        with col3:
+            st.metric("Primary Focus (Age 0-5)", f"{stats['age_0_5']:,}")
+        with col4:
+            st.metric("Active Regions", f"{stats['num_districts']:,} Districts")
+
+
+# Recorded from here on; the try/finally stops the recording however the rerun ends
+if instrumenting:
+    start_rerun()
+try:
+    # --- HEADER SECTION ---
+    st.title("📊 UIDAI 2025 Enrollment Analytics")
+    st.markdown("### *Focusing on New Enrollment Velocity and Regional Performance*")
+
+    # Summary Metrics: drawn from the saved summary of this data version, when
+    # there is one, before any dataset is loaded
+    refresher = data_refresher()
+    # One data version for the whole rerun, even if a newer one is swapped in meanwhile
+    pinned = refresher.current(wait=False)
+    data_version = pinned.version if pinned is not None else current_version()
+    snapshot = open_snapshot(data_version)
+    header = st.empty()
+    saved_stats = read_summary(data_version)
+    if saved_stats is None and snapshot is not None:
+        saved_stats = snapshot.summary()
+    if saved_stats is not None:
+        render_header(saved_stats)
+        startup['first paint'] = time.perf_counter() - APP_START
+
+    # --- SIDEBAR FILTERS ---
+    st.sidebar.header("🔍 Filters")
+    # Without a snapshot, aggregate once per data version; every chart below
+    # reads from the cube's roll-ups
+    if snapshot is not None:
+        states, first_day, last_day = snapshot.states, *snapshot.date_range
+    else:
+        states = sorted(current_cube().state['state'].dropna().astype(str).tolist())
+        calendar = current_cube().calendar['date']
+        first_day, last_day = calendar.min().date(), calendar.max().date()
+    selected_state = st.sidebar.selectbox("Select State", ["All"] + states)
+    # Districts come from the cube's region index, so drill-down is a slice
+    if selected_state == "All":
+        district_list = ["All"]
+    elif snapshot is not None:
+        district_list = ["All"] + snapshot.districts(selected_state)
+    else:
+        district_list = ["All"] + sorted(str(d) for d in current_cube().regions.districts(selected_state))
+    selected_district = st.sidebar.selectbox("Select District", district_list, disabled=selected_state == "All")
+    region = (selected_state, selected_district)
+
+    # Any date window is answered from the cube's prefix-sum time index
+    window = st.sidebar.slider("Date Range", min_value=first_day, max_value=last_day, value=(first_day, last_day))
+    start, end = (None, None) if window == (first_day, last_day) else (str(window[0]), str(window[1]))
+
+    # Exact metrics for the selected window; the saved summary is exact for
+    # the full period of its version
+    if start is None and end is None and saved_stats is not None:
+        stats = saved_stats
+    else:
+        stats = summary_statistics(data_version, start, end, current_cube())
+        if start is None and end is None:
+            write_summary(data_version, stats)
+        render_header(stats)
+    startup.setdefault('first paint', time.perf_counter() - APP_START)
+
+
+    @functools.cache
+    def region_cube():
+        """
+        The cube of the selected region, built at most once per rerun; its
+        time index is cut from the national one
+        """
+        return current_cube().filter(selected_state, district=selected_district)
+
+    @functools.cache
+    def filtered_enrol():
+        """The cube restricted to the selected region and window, built at most once per rerun"""
+        return region_cube().filter(start=start, end=end)
+
+    # --- MAIN DASHBOARD ---
+    # Only the selected section is computed; st.tabs would build every tab's figures
+    section = st.radio(
+        "Section", ["📊 Performance Leaderboards", "🍼 Birth & Child Stats", "📅 Monthly Pulse"],
+        horizontal=True, label_visibility="collapsed"
+    )
+
+    if section == "📊 Performance Leaderboards":
+        # Leaders and laggards share one coverage computation
+        leaders, laggards = memo_figure(
+            'coverage_extremes', None, lambda: lazy('analysis').coverage_extremes_charts(
+                current_cube(), load_population(), 15, start, end
+            )
+        )
+
+        st.subheader("Enrollment Density: Performance Leaders")
+        render_chart(leaders)
+        st.info("💡 High density indicates effective outreach relative to the total population baseline.")
+
+        st.subheader("Enrollment Density: Performance Laggards")
+        render_chart(laggards)
+        st.warning("⚠️ These regions may require targeted registration awareness programs.")
+
+        st.subheader("Adult Enrollment Leaderboard (18+)")
+        render_chart(memo_figure('adult_enrollment', None, lambda: lazy('analysis').adult_enrollment_by_state_chart(
+            current_cube(), start, end
+        )))
+
+        st.subheader("Regional Age Distribution Focus (Top 15 States)")
+        render_chart(memo_figure('age_group_composition', None, lambda: lazy('analysis').age_group_composition(
+            current_cube(), start, end
+        )))
+
+    elif section == "🍼 Birth & Child Stats":
+        st.subheader("Child Enrollment (Age 0-5) Velocity vs Birth Capacity")
+        render_chart(memo_figure(
+            'birth_scatter', region, lambda: lazy('analysis').enrollment_vs_birth_scatter(filtered_enrol(), load_births())
+        ))
+
+        st.success("""
+        **Analytical Note:** The scatter plot compares **Actual 2025 Momentum** against **State Birth Capacity**. 
+        States falling significantly below the trend line (regression line) are priority zones for newborn enrollment.
+        """)
+
+        st.subheader("Priority Zones: Furthest Below the Trend Line")
+        # National ranking: a single state has no trend line to fall below
+        priority = memo_figure(
+            'priority_zones', None, lambda: lazy('analysis').priority_zones_table(
+                current_cube().filter(start=start, end=end), load_births()
+            )
+        )
+        st.dataframe(priority, use_container_width=True, hide_index=True)
+
+    else:
+        st.subheader("Monthly Enrollment Velocity (2025)")
+        render_chart(memo_figure('monthly_velocity', region, lambda: lazy('analysis').monthly_velocity_chart(
+            region_cube(), start, end
+        )))
+
+        st.subheader("Rolling Velocity and Anomalies")
+        render_chart(memo_figure('rolling_velocity', region, lambda: lazy('analysis').rolling_velocity_chart(filtered_enrol())))
+        st.dataframe(
+            memo_figure('district_anomalies', region, lambda: lazy('analysis').district_anomalies_table(filtered_enrol())),
+            use_container_width=True, hide_index=True
+        )
+        st.caption("Spikes and drops: days at least 3 standard deviations from the district's previous 28 days.")
+
+        st.subheader("National Age Group Breakdown")
+        render_chart(memo_figure('age_distribution', region, lambda: lazy('analysis').age_distribution(
+            region_cube(), start, end
+        )))
+        st.info("Peaks in the monthly velocity often correspond to government enrollment drives or school registration cycles.")
+
+    st.markdown("---")
+    st.caption(f"Data Source: enrolment_merged_cleaned.csv | Covering period: {stats['date_range'] or 'no records'}")
+    startup['rerun complete'] = time.perf_counter() - APP_START
+
+    # Started once this rerun's figures are drawn, with the data modules
+    # imported here first: the refresher thread would otherwise import pandas
+    # while plotly, drawing snapshot figures, finds it half-initialized
+    lazy('store')
+    refresher.start()
+
+    # --- DATA VERSION ---
+    refresh = refresher.status()
+    st.sidebar.caption(f"Data version: {data_version}")
+    if refresh['version'] is not None:
+        st.sidebar.caption(f"Last refresh: {refresh['loaded_at']}, loaded in {refresh['seconds']:.2f}s")
+    if refresh['refreshing']:
+        st.sidebar.info(f"Loading data version {refresh['refreshing']} in the background...")
+    elif refresh['version'] not in (None, data_version):
+        st.sidebar.info(f"Data version {refresh['version']} is ready and shows from your next interaction.")
+    if refresh['last_error']:
+        st.sidebar.warning(f"Last refresh failed, still serving {data_version}: {refresh['last_error']}")
+
+    # --- DEBUG PANEL ---
+    if instrumenting:
+        records = finish_rerun()
+        with st.sidebar.expander("⏱️ Rerun timings"):
+            st.dataframe(
+                [
+                    {
+                        'step': "  " * r['depth'] + r['name'],
+                        'seconds': r['seconds'],
+                        'rows_in': r.get('rows_in'),
+                        'rows_out': r.get('rows_out'),
+                        'peak_mb': r.get('peak_mb'),
+                    }
+                    for r in records
+                ],
+                use_container_width=True
+            )
+            st.caption(f"Snapshot: {snapshot.version if snapshot else 'none'}")
+            st.caption("Data refreshes")
+            st.dataframe(refresh['history'], use_container_width=True)
+            st.caption("Figure cache: " + ", ".join(f"{k} {v:,}" for k, v in figure_cache.stats().items()))
+            st.caption("Startup (seconds since script start; imports are their own duration)")
+            st.dataframe(
+                [{'milestone': name, 'seconds': round(seconds, 4)} for name, seconds in startup.items()],
+                use_container_width=True
+            )
+            st.download_button(
+                "Download JSON", json.dumps(records, indent=2),
+                file_name="rerun_timings.json", mime="application/json"
+            )
+finally:
+    # Streamlit ends a rerun early by raising (st.rerun, st.stop, a newer
+    # widget event); the recording must stop all the same
+    finish_rerun()
@@ -0,0 +1,79 @@
+"""
+Compute Backends for the Enrollment Metrics
+
+`enhanced_metrics` is written against pandas, the reference backend. Its
+row-scanning functions are marked `dispatched`: while another backend is
+active they run that backend's implementation of the same name instead,
+and return the same pandas results.
+
+    set_backend('polars')            # or UIDAI_BACKEND=polars
+    calculate_state_performance(df)  # runs polars_metrics.calculate_state_performance
+
+    with using_backend('pandas'):
+        ...
+
+An implementation raises `BackendUnsupported` for arguments it does not
+cover (e.g. HyperLogLog distinct counts), and the reference runs instead.
+"""
+
+import functools
+import importlib
+import os
+from contextlib import contextmanager
+
+BACKEND_ENV = "UIDAI_BACKEND"
+
+# Backend name -> module of its implementations (None: the functions themselves)
+BACKEND_MODULES = {
+    'pandas': None,
+    'polars': 'polars_metrics',
+}
+
+
+class BackendUnsupported(Exception):
+    """Raised by a backend implementation for arguments only the reference handles"""
+
+
+_active = {'name': 'pandas', 'module': None}
+
+
+def get_backend():
+    return _active['name']
+
+
+def set_backend(name):
+    """Selects the backend of every dispatched function; returns the previous one"""
+    if name not in BACKEND_MODULES:
+        raise ValueError(f"backend must be one of {sorted(BACKEND_MODULES)}, got {name!r}")
+    # Imported now, so a missing engine fails here rather than mid-dashboard
+    module = importlib.import_module(BACKEND_MODULES[name]) if BACKEND_MODULES[name] else None
+    previous = _active['name']
+    _active.update(name=name, module=module)
+    return previous
+
+
+@contextmanager
+def using_backend(name):
+    previous = set_backend(name)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+
+def dispatched(func):
+    """Runs the active backend's implementation of `func`, if it has one"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        impl = getattr(_active['module'], func.__name__, None)
+        if impl is not None:
+            try:
+                return impl(*args, **kwargs)
+            except BackendUnsupported:
+                pass
+        return func(*args, **kwargs)
+    return wrapper
+
+
+if os.environ.get(BACKEND_ENV):
+    set_backend(os.environ[BACKEND_ENV])
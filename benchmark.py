@@ -0,0 +1,329 @@
+"""
+Benchmark Suite for Enrollment Metrics and Charts
+
+Generates synthetic enrolment data with the real schema and realistic key
+cardinalities, then times and memory-profiles every public function of
+`enhanced_metrics` and every chart builder of `analysis`, both on the raw
+frame and on the pre-aggregated cube. Results are written as JSON so runs
+can be compared for regressions:
+
+    python benchmark.py --rows 1000000 10000000 --output bench.json
+    python benchmark.py --rows 1000000 --compare bench.json
+    python benchmark.py --rows 1000000 --backend polars
+    python benchmark.py --rows 1000000 --parity polars   # backend vs pandas reference
+"""
+
+import argparse
+import gc
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import enhanced_metrics
+from backends import BACKEND_MODULES, set_backend, using_backend
+from cube import EnrollmentCube, build_enrollment_cube
+from instrumentation import figure_points
+from utils import CANONICAL_STATES, _prepare_enrollment_frame, load_birth_data
+
+DEFAULT_ROWS = [1_000_000, 10_000_000, 50_000_000]
+
+# Roughly the shape of the national extract
+NUM_DISTRICTS = 780
+PINCODES_PER_DISTRICT = 25
+DATE_RANGE = ("2025-03-01", "2025-12-31")
+
+METRIC_FUNCTIONS = [
+    'calculate_enrollment_velocity',
+    'calculate_state_performance',
+    'calculate_district_performance',
+    'calculate_temporal_trends',
+    'get_age_distribution_by_state',
+    'get_summary_statistics',
+    'calculate_population_coverage',
+    'get_coverage_extremes',
+    'calculate_adult_enrollment_by_state',
+    'get_top_pincodes',
+    'fit_birth_regression',
+    'get_priority_zones',
+    'calculate_rolling_velocity',
+]
+
+CHART_FUNCTIONS = [
+    'enrollment_trend',
+    'monthly_velocity_chart',
+    'state_performance_ranking',
+    'district_leaderboard',
+    'age_group_composition',
+    'age_distribution',
+    'state_wise_enrollment',
+    'enrollment_vs_birth_scatter',
+    'coverage_gap_analysis',
+    'population_coverage_chart',
+    'bottom_population_coverage_chart',
+    'adult_enrollment_by_state_chart',
+    'rolling_velocity_chart',
+]
+
+# Functions that need a reference table besides the enrolment data
+NEEDS_POPULATION = {
+    'calculate_population_coverage', 'get_coverage_extremes',
+    'population_coverage_chart', 'bottom_population_coverage_chart',
+}
+NEEDS_BIRTHS = {
+    'fit_birth_regression', 'get_priority_zones', 'enrollment_vs_birth_scatter', 'coverage_gap_analysis',
+}
+
+
+# Calls run under the reference and the backend under test by check_parity
+PARITY_WINDOW = {'start': '2025-05-01', 'end': '2025-07-15'}
+PARITY_CASES = [
+    ('calculate_enrollment_velocity', {}),
+    ('calculate_state_performance', {}),
+    ('calculate_state_performance', {'top_n': 10}),
+    ('calculate_district_performance', {}),
+    ('calculate_district_performance', {'top_n': 25}),
+    ('calculate_temporal_trends', {}),
+    ('get_age_distribution_by_state', {}),
+    ('get_age_distribution_by_state', PARITY_WINDOW),
+    ('get_summary_statistics', {}),
+    ('get_summary_statistics', PARITY_WINDOW),
+    ('calculate_adult_enrollment_by_state', {}),
+    ('calculate_adult_enrollment_by_state', PARITY_WINDOW),
+    ('get_top_pincodes', {}),
+]
+
+
+def generate_enrollment_frame(rows, seed=0):
+    """
+    Synthetic raw enrolment rows (date, state, district, pincode, three age
+    columns) with ~36 states, ~780 districts, ~19.5k pincodes and one year of
+    dates. States are drawn with population-like skew.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(*DATE_RANGE, freq="D")
+
+    # Districts belong to states in proportion to a skewed weight
+    state_weights = rng.pareto(1.2, len(CANONICAL_STATES)) + 0.05
+    state_weights /= state_weights.sum()
+    district_state = rng.choice(len(CANONICAL_STATES), NUM_DISTRICTS, p=state_weights)
+    district_weights = state_weights[district_state] * rng.uniform(0.5, 1.5, NUM_DISTRICTS)
+    district_weights /= district_weights.sum()
+
+    district = rng.choice(NUM_DISTRICTS, rows, p=district_weights)
+    pincode = 100000 + district * PINCODES_PER_DISTRICT + rng.integers(0, PINCODES_PER_DISTRICT, rows)
+    date = rng.integers(0, len(dates), rows)
+
+    # Categorical columns stand in for the CSV's repeated strings
+    return pd.DataFrame({
+        'date': pd.Categorical.from_codes(date, dates.strftime("%d-%m-%Y")),
+        'state': pd.Categorical.from_codes(district_state[district], CANONICAL_STATES),
+        'district': pd.Categorical.from_codes(district, [f"District {i:03d}" for i in range(NUM_DISTRICTS)]),
+        'pincode': pincode,
+        'age_0_5': rng.poisson(4.0, rows),
+        'age_5_17': rng.poisson(2.5, rows),
+        'age_18_greater': rng.poisson(0.8, rows),
+    })
+
+
+def _synthetic_population():
+    births = load_birth_data()
+    # Population scaled from births keeps the coverage ratios plausible
+    return pd.DataFrame({'state': births['state'], 'Population': births['total_births'] * 55})
+
+
+def _rows_out(result):
+    if isinstance(result, tuple):
+        return sum(_rows_out(item) for item in result)
+    if isinstance(result, dict):
+        return sum(_rows_out(item) for item in result.values() if not np.isscalar(item))
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if hasattr(result, 'data'):
+        return figure_points(result)
+    return 1
+
+
+def _measure(func, args, repeats):
+    """Best wall time over `repeats` runs, then one traced run for peak memory"""
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(timings), peak
+
+
+def run_suite(rows, repeats=3, functions=None, seed=0):
+    """Runs every benchmark at one data size and returns the result records"""
+    population, births = _synthetic_population(), load_birth_data()
+    records = []
+
+    def record(name, source, func, args, rows_in):
+        try:
+            result, seconds, peak = _measure(func, args, repeats)
+            records.append({
+                'rows': rows, 'input': source, 'function': name,
+                'seconds': round(seconds, 6), 'peak_mb': round(peak / 1e6, 3),
+                'rows_in': rows_in, 'rows_out': _rows_out(result),
+            })
+        except Exception as exc:
+            # A broken function should not hide the rest of the run
+            records.append({'rows': rows, 'input': source, 'function': name, 'error': repr(exc)})
+        print(f"  {source:<6} {name:<40} {records[-1].get('seconds', 'error')}")
+
+    raw = generate_enrollment_frame(rows, seed)
+    record('ingest', 'raw', lambda: _prepare_enrollment_frame(raw.copy()), (), rows)
+    frame = _prepare_enrollment_frame(raw)
+    del raw
+    record('build_enrollment_cube', 'frame', build_enrollment_cube, (frame,), rows)
+    cube = build_enrollment_cube(frame)
+
+    for module, names in [(enhanced_metrics, METRIC_FUNCTIONS), (analysis, CHART_FUNCTIONS)]:
+        for name in names:
+            if functions and name not in functions:
+                continue
+            func = getattr(module, name)
+            extra = (population,) if name in NEEDS_POPULATION else (births,) if name in NEEDS_BIRTHS else ()
+            record(name, 'frame', func, (frame,) + extra, rows)
+            # A fresh cube over the same base per call, so roll-ups cached by
+            # an earlier repeat do not flatter the timing
+            record(name, 'cube', lambda: func(EnrollmentCube(cube.base), *extra), (), len(cube.base))
+    return records
+
+
+def _canonical(frame):
+    """Rows in a fixed order with categoricals as plain values, so tie order and key dtypes do not matter"""
+    frame = frame.copy()
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(frame[col].cat.categories.dtype)
+    return frame.sort_values(list(frame.columns), ignore_index=True)
+
+
+def _parity_diff(expected, actual):
+    """None if a backend's result matches the reference's, else what differs"""
+    if isinstance(expected, dict):
+        if expected.keys() != actual.keys():
+            return f"keys {sorted(expected)} != {sorted(actual)}"
+        for key in expected:
+            diff = _parity_diff(expected[key], actual[key])
+            if diff:
+                return f"[{key}] {diff}"
+        return None
+    if isinstance(expected, pd.DataFrame):
+        if list(expected.columns) != list(actual.columns):
+            return f"columns {list(expected.columns)} != {list(actual.columns)}"
+        try:
+            pd.testing.assert_frame_equal(
+                _canonical(expected), _canonical(actual), check_dtype=False, check_index_type=False
+            )
+        except AssertionError as exc:
+            return str(exc).splitlines()[0]
+        return None
+    return None if expected == actual else f"{expected!r} != {actual!r}"
+
+
+def check_parity(rows, backend, seed=0):
+    """
+    Runs PARITY_CASES under the pandas reference and under `backend`, on the
+    raw frame and on the cube, and returns the mismatches.
+    """
+    frame = _prepare_enrollment_frame(generate_enrollment_frame(rows, seed))
+    cube = build_enrollment_cube(frame)
+    failures = []
+    for source, data in [('frame', frame), ('cube', cube)]:
+        for name, kwargs in PARITY_CASES:
+            func = getattr(enhanced_metrics, name)
+            with using_backend('pandas'):
+                expected = func(data, **kwargs)
+            with using_backend(backend):
+                actual = func(data, **kwargs)
+            diff = _parity_diff(expected, actual)
+            label = f"{name}({', '.join(f'{k}={v}' for k, v in kwargs.items())})"
+            print(f"  {source:<6} {label:<70} {'ok' if diff is None else 'MISMATCH'}")
+            if diff is not None:
+                failures.append({'rows': rows, 'input': source, 'call': label, 'diff': diff})
+    return failures
+
+
+def compare(current, baseline_path, threshold=1.2):
+    """Prints functions that got slower than `threshold` x the baseline run"""
+    with open(baseline_path) as f:
+        baseline = {
+            (r['rows'], r['input'], r['function']): r for r in json.load(f)['results'] if 'seconds' in r
+        }
+    print(f"\nComparison against {baseline_path} (flagging > {threshold:.1f}x):")
+    for r in current:
+        old = baseline.get((r['rows'], r['input'], r['function']))
+        if old is None or 'seconds' not in r or old['seconds'] == 0:
+            continue
+        ratio = r['seconds'] / old['seconds']
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"  {r['rows']:>10,} {r['input']:<9} {r['function']:<40} {ratio:6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--functions', nargs='*', help="Only benchmark these functions")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    parser.add_argument('--backend', choices=sorted(BACKEND_MODULES), default='pandas',
+                        help="Compute backend of the metric functions (see backends.py)")
+    parser.add_argument('--parity', choices=sorted(set(BACKEND_MODULES) - {'pandas'}),
+                        help="Check this backend against the pandas reference instead of timing")
+    args = parser.parse_args()
+
+    if args.parity:
+        failures = []
+        for rows in args.rows:
+            print(f"Parity of {args.parity} at {rows:,} rows...")
+            failures.extend(check_parity(rows, args.parity, args.seed))
+        for failure in failures:
+            print(f"MISMATCH {failure['rows']:,} {failure['input']} {failure['call']}: {failure['diff']}")
+        raise SystemExit(1 if failures else 0)
+
+    set_backend(args.backend)
+
+    results = []
+    for rows in args.rows:
+        print(f"Benchmarking {rows:,} rows...")
+        results.extend(run_suite(rows, args.repeats, args.functions, args.seed))
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'backend': args.backend,
+            'repeats': args.repeats,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
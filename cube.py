@@ -0,0 +1,618 @@
+"""
+Pre-aggregated Enrollment Cube
+
+Sums the age counts once at (state, district, pincode, date) grain and derives
+the smaller roll-ups from that base, so the metric functions can answer from
+the roll-up matching their grain instead of regrouping the raw rows.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from sketch import DEFAULT_PRECISION, SketchTable
+from utils import build_calendar, enforce_enrollment_schema, prepare_enrollment_keys
+
+AGE_COLUMNS = ['age_0_5', 'age_5_17', 'age_18_greater']
+SUM_COLUMNS = AGE_COLUMNS + ['total_enrollments', 'records']
+GRAIN = ['state', 'district', 'pincode', 'date']
+
+# Grouping keys and distinct counts of the region roll-ups
+ROLLUP_SPECS = {
+    'pincode': (['state', 'district', 'pincode'], {}),
+    'district': (['state', 'district'], {'pincode': 'num_pincodes'}),
+    'state': (['state'], {'district': 'num_districts', 'pincode': 'num_pincodes'}),
+}
+
+# Below this many rows a process pool costs more than it saves
+PARALLEL_MIN_ROWS = 200_000
+
+
+def with_totals(df):
+    """Returns the frame with a total_enrollments column, copying only if it must be added"""
+    if 'total_enrollments' not in df.columns:
+        df = df.copy()
+        df['total_enrollments'] = (
+            df['age_0_5'].astype('int64') + df['age_5_17'].astype('int64') + df['age_18_greater'].astype('int64')
+        )
+    return df
+
+
+def _monthly(daily):
+    """Rolls a daily series up to (year, month)"""
+    dated = daily.assign(year=daily['date'].dt.year, month=daily['date'].dt.month)
+    return dated.groupby(['year', 'month'])[SUM_COLUMNS].sum().reset_index()
+
+
+def _aggregate(frame, keys, distinct=None):
+    """
+    Sums the count columns of `frame` by `keys` and adds distinct counts.
+
+    Works on raw rows and on cube levels alike: raw rows have no `records`
+    column, so the row count per group is used instead.
+    """
+    distinct = distinct or {}
+    grouped = frame.groupby(keys, observed=True)
+    sums = [col for col in SUM_COLUMNS if col in frame.columns]
+    agg = grouped[sums].sum()
+    if 'records' not in agg.columns:
+        agg['records'] = grouped.size()
+    for col, name in distinct.items():
+        agg[name] = grouped[col].nunique()
+    return agg.reset_index()
+
+
+def _runs(codes, key_of):
+    """
+    {key_of(first row): (start, stop)} for each run of equal `codes`, or
+    None when some code occurs in more than one run.
+    """
+    starts = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate([[0], starts]) if len(codes) else starts
+    if len(np.unique(codes[starts])) < len(starts):
+        return None
+    stops = np.append(starts[1:], len(codes))
+    return {key_of(start): (start, stop) for start, stop in zip(starts.tolist(), stops.tolist())}
+
+
+class RegionIndex:
+    """
+    Row ranges of each state and each (state, district) in a frame whose rows
+    are grouped by state, then district, so a region filter is a slice.
+    """
+
+    def __init__(self, frame):
+        state_codes, states = pd.factorize(frame['state'])
+        district_codes, districts = pd.factorize(frame['district'])
+        state_keys = [None] + list(states)
+        district_keys = [None] + list(districts)
+
+        self.state_ranges = _runs(state_codes, lambda row: state_keys[state_codes[row] + 1])
+        self.district_ranges = _runs(
+            state_codes.astype('int64') * (len(districts) + 1) + district_codes,
+            lambda row: (state_keys[state_codes[row] + 1], district_keys[district_codes[row] + 1])
+        )
+        self.contiguous = self.state_ranges is not None and self.district_ranges is not None
+
+    def state_rows(self, state):
+        return slice(*self.state_ranges.get(state, (0, 0)))
+
+    def district_rows(self, state, district):
+        return slice(*self.district_ranges.get((state, district), (0, 0)))
+
+    def districts(self, state):
+        """Districts of `state` in row order"""
+        return [d for s, d in self.district_ranges if s == state and d is not None]
+
+
+class TimeIndex:
+    """
+    Prefix sums over the daily series, nationally, per state and per
+    (state, district), so the sums of any inclusive [start, end] window are
+    the difference of two prefix rows instead of a filter and regroup.
+
+    Each level holds a (regions, days + 1, columns) array of SUM_COLUMNS
+    plus `active_days` (days with at least one record). Rows with no date
+    are left out.
+    """
+
+    COLUMNS = SUM_COLUMNS + ['active_days']
+
+    def __init__(self, base, regions, dates):
+        self.dates = pd.DatetimeIndex(dates)
+        self.districts = list(regions.district_ranges)
+        bounds = np.array(list(regions.district_ranges.values()), dtype='int64').reshape(-1, 2)
+        row_district = np.repeat(np.arange(len(self.districts)), bounds[:, 1] - bounds[:, 0])
+
+        # Dense (district, day) sums; the base is in region order, so rows
+        # map to districts by position
+        day = self.dates.get_indexer(base['date'])
+        dated = day >= 0
+        cells = row_district[dated] * len(self.dates) + day[dated]
+        size = len(self.districts) * len(self.dates)
+        daily = np.stack([
+            np.bincount(cells, weights=base[col].to_numpy()[dated], minlength=size)
+            for col in SUM_COLUMNS
+        ], axis=-1).round().astype('int64').reshape(len(self.districts), len(self.dates), len(SUM_COLUMNS))
+
+        # Districts of a state are adjacent, so states are contiguous blocks
+        district_states = [state for state, _ in self.districts]
+        state_starts = [i for i, state in enumerate(district_states) if i == 0 or state != district_states[i - 1]]
+        self.states = [district_states[i] for i in state_starts]
+        state_daily = np.add.reduceat(daily, state_starts, axis=0) if state_starts else daily
+
+        self._prefix = {
+            'district': self._cumulative(daily),
+            'state': self._cumulative(state_daily),
+            'national': self._cumulative(daily.sum(axis=0, keepdims=True)),
+        }
+
+    @staticmethod
+    def _cumulative(daily):
+        active = (daily[..., -1:] > 0).astype('int64')
+        daily = np.concatenate([daily, active], axis=-1)
+        prefix = np.zeros((daily.shape[0], daily.shape[1] + 1, daily.shape[2]), dtype='int64')
+        np.cumsum(daily, axis=1, out=prefix[:, 1:])
+        return prefix
+
+    def _bounds(self, start, end):
+        lo = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return lo, max(lo, hi)
+
+    def _window(self, level, start, end):
+        lo, hi = self._bounds(start, end)
+        prefix = self._prefix[level]
+        return prefix[:, hi] - prefix[:, lo]
+
+    def sums(self, start=None, end=None, state=None, district=None):
+        """Window sums of one region (the nation by default) as a Series over COLUMNS"""
+        if district is not None:
+            level, keys = 'district', self.districts
+            key = (state, district)
+        elif state is not None:
+            level, keys, key = 'state', self.states, state
+        else:
+            level, keys, key = 'national', [None], None
+        if key not in keys:
+            return pd.Series(0, index=self.COLUMNS)
+        return pd.Series(self._window(level, start, end)[keys.index(key)], index=self.COLUMNS)
+
+    def restrict(self, state, district=None):
+        """
+        The index a cube of one state (or one of its districts) would build
+        from its rows, cut from this one instead; None if the region has no
+        dated rows
+        """
+        rows = [i for i, key in enumerate(self.districts) if key[0] == state and district in (None, key[1])]
+        if not rows:
+            return None
+        district_prefix = self._prefix['district'][rows]
+        if district is None:
+            region_prefix = self._prefix['state'][[self.states.index(state)]]
+        else:
+            region_prefix = district_prefix
+        # Only the dates the region has records on; the region adds nothing
+        # on the others, so its prefix rows carry over unchanged
+        records = np.diff(region_prefix[0, :, self.COLUMNS.index('records')])
+        kept = np.flatnonzero(records > 0)
+        columns = np.concatenate([[0], kept + 1])
+
+        index = TimeIndex.__new__(TimeIndex)
+        index.dates = self.dates[kept]
+        index.districts = [self.districts[i] for i in rows]
+        index.states = [state]
+        index._prefix = {
+            'district': district_prefix[:, columns],
+            'state': region_prefix[:, columns],
+            'national': region_prefix[:, columns],
+        }
+        return index
+
+    def daily_frame(self, start=None, end=None):
+        """
+        National daily sums over the window as a frame like the daily
+        roll-up; days without records are left out
+        """
+        lo, hi = self._bounds(start, end)
+        sums = np.diff(self._prefix['national'][0, lo:hi + 1], axis=0)
+        frame = pd.DataFrame(sums[:, :len(SUM_COLUMNS)], columns=SUM_COLUMNS)
+        frame.insert(0, 'date', self.dates[lo:hi])
+        return frame[frame['records'] > 0].reset_index(drop=True)
+
+    def daily(self, level, column='total_enrollments'):
+        """
+        Region keys of `level` ('national', 'state' or 'district') and the
+        dense (regions, dates) array of one column's daily sums
+        """
+        keys = {'national': [None], 'state': self.states, 'district': self.districts}[level]
+        return keys, np.diff(self._prefix[level][..., self.COLUMNS.index(column)], axis=1)
+
+    def rollup(self, level, start=None, end=None):
+        """
+        'state' or 'district' window sums as a frame like the roll-ups (without
+        distinct counts); regions with no records in the window are left out.
+        """
+        sums = pd.DataFrame(self._window(level, start, end), columns=self.COLUMNS)
+        if level == 'state':
+            keys = pd.DataFrame({'state': self.states})
+        else:
+            keys = pd.DataFrame(self.districts, columns=['state', 'district'])
+        frame = pd.concat([keys, sums], axis=1)
+        frame = frame[(frame['records'] > 0) & keys.notna().all(axis=1)]
+        return frame.reset_index(drop=True)
+
+
+class EnrollmentCube:
+    """
+    Summed enrolment counts at (state, district, pincode, date) grain.
+
+    Roll-ups are derived from the next smaller level on first access and kept:
+    `pincode` (state, district, pincode), `district` (state, district),
+    `state`, `daily` (date) and `monthly` (year, month), plus the `calendar`
+    dimension of the covered dates and the `regions` index of the base.
+    `version` identifies the data the cube was built from, for callers that
+    cache on it.
+    """
+
+    def __init__(self, base=None, version=None, load_base=None):
+        # A persisted cube may defer reading its base until a filter needs it
+        self._base = base
+        self._load_base = load_base
+        self.version = version
+        # Distinct-count sketches by precision (see sketches())
+        self._sketches = {}
+
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = self._load_base()
+        return self._base
+
+    @classmethod
+    def from_frame(cls, df):
+        """Builds the cube from raw enrolment rows"""
+        df = with_totals(df)
+        grouped = df.groupby(GRAIN, observed=True, dropna=False)
+        base = grouped[AGE_COLUMNS + ['total_enrollments']].sum()
+        base['records'] = grouped.size()
+        return cls(base.reset_index())
+
+    @cached_property
+    def pincode(self):
+        return _aggregate(self.base, *ROLLUP_SPECS['pincode'])
+
+    @cached_property
+    def district(self):
+        return _aggregate(self.pincode, *ROLLUP_SPECS['district'])
+
+    @cached_property
+    def state(self):
+        return _aggregate(self.pincode, *ROLLUP_SPECS['state'])
+
+    @cached_property
+    def daily(self):
+        return _aggregate(self.base, ['date'])
+
+    @cached_property
+    def monthly(self):
+        return _monthly(self.daily)
+
+    @cached_property
+    def calendar(self):
+        return build_calendar(self.daily['date'])
+
+    @cached_property
+    def sums(self):
+        return self.base[SUM_COLUMNS].sum()
+
+    @cached_property
+    def regions(self):
+        """RegionIndex over the base (sorted by GRAIN first if its regions are not contiguous)"""
+        index = RegionIndex(self.base)
+        if not index.contiguous:
+            # e.g. a stored base stacked from several parts
+            self._base = self.base.sort_values(GRAIN, kind='stable', ignore_index=True)
+            index = RegionIndex(self._base)
+        return index
+
+    def sketches(self, precision=DEFAULT_PRECISION):
+        """SketchTable of the base at `precision`, built on first use"""
+        if precision not in self._sketches:
+            self._sketches[precision] = SketchTable.from_frame(self.base, precision)
+        return self._sketches[precision]
+
+    @cached_property
+    def time_index(self):
+        """TimeIndex of the base over the covered dates"""
+        # Indexed first: building the index may re-sort the base
+        regions = self.regions
+        return TimeIndex(self.base, regions, self.daily['date'].dropna())
+
+    def filter(self, state=None, start=None, end=None, district=None):
+        """
+        Returns a cube restricted to one state and optionally one of its
+        districts ("All" or None keeps every region), and to the inclusive
+        [start, end] date window.
+
+        Region filters are zero-copy slices of the base through `regions`;
+        only the date window is matched row by row, within that slice. A
+        region cube gets its time index cut from this cube's, if built, so
+        its windows are answered without indexing its rows again.
+        """
+        state = None if state == "All" else state
+        district = None if district == "All" else district
+        if district is not None and state is None:
+            raise ValueError("A district filter needs its state")
+        if state is None and start is None and end is None:
+            return self
+        if district is not None:
+            rows = self.regions.district_rows(state, district)
+        elif state is not None:
+            rows = self.regions.state_rows(state)
+        else:
+            rows = slice(None)
+        # Indexed first: building the index may re-sort the base
+        base = self.base.iloc[rows]
+        if start is not None or end is not None:
+            base = _date_window(base, start, end)
+        cube = EnrollmentCube(base.reset_index(drop=True), version=self.version)
+        if start is None and end is None and 'time_index' in self.__dict__:
+            index = self.time_index.restrict(state, district)
+            if index is not None:
+                cube.__dict__['time_index'] = index
+        return cube
+
+
+@instrumented
+def build_enrollment_cube(df):
+    """Builds the enrolment cube from a prepared enrolment frame"""
+    return EnrollmentCube.from_frame(df)
+
+
+def _compact(parts):
+    """Folds partial cube bases into one, re-summing keys seen in several parts"""
+    # Chunks carry their own category sets; concat would fall back to plain
+    # values, so align them on the union first
+    for col in GRAIN:
+        if all(isinstance(part[col].dtype, pd.CategoricalDtype) for part in parts):
+            categories = parts[0][col].cat.categories
+            for part in parts[1:]:
+                categories = categories.union(part[col].cat.categories)
+            parts = [part.assign(**{col: part[col].cat.set_categories(categories)}) for part in parts]
+    merged = pd.concat(parts, ignore_index=True)
+    grouped = merged.groupby(GRAIN, observed=True, dropna=False)
+    return grouped[AGE_COLUMNS + ['total_enrollments', 'records']].sum().reset_index()
+
+
+@instrumented
+def stream_enrollment_cube(filepath, chunksize=500_000):
+    """
+    Builds the enrolment cube from a CSV without materializing its rows.
+
+    The file is read `chunksize` rows at a time; each chunk is parsed,
+    canonicalized and reduced to a partial cube base, and the partials are
+    folded into the aggregate once they outgrow both one chunk and the
+    aggregate itself. The aggregate is thus regrouped a logarithmic number
+    of times, and peak memory stays within about twice its size plus a chunk.
+    """
+    parts, buffered, compacted = [], 0, 0
+    for chunk in pd.read_csv(filepath, chunksize=chunksize):
+        part = EnrollmentCube.from_frame(prepare_enrollment_keys(chunk)).base
+        parts.append(part)
+        buffered += len(part)
+        if buffered > max(chunksize, compacted) and len(parts) > 1:
+            parts = [_compact(parts)]
+            compacted, buffered = len(parts[0]), 0
+
+    if not parts:
+        return EnrollmentCube(pd.DataFrame(columns=GRAIN + SUM_COLUMNS))
+    base = _compact(parts) if len(parts) > 1 else parts[0]
+    return EnrollmentCube(enforce_enrollment_schema(base))
+
+
+# Call token -> (frame, order), set in the parent right before the pool
+# forks, so workers inherit the frame instead of receiving a pickled copy of
+# each partition. Parallel aggregations run one at a time (they each use
+# every worker anyway), so no caller updates or clears the sources while
+# another caller's pool forks.
+_partition_source = {}
+_partition_tokens = itertools.count()
+_fork_lock = threading.Lock()
+
+
+def _aggregate_partition(token, start, stop, keys, distinct):
+    frame, order = _partition_source[token]
+    return _aggregate(frame.take(order[start:stop]), keys, distinct)
+
+
+def _partition_rows(frame, keys, workers):
+    """
+    Assigns rows to `workers` key-disjoint partitions.
+
+    The unit of partitioning is the state, or the (state, district) pair when
+    `keys` contain the district, so no group straddles two partitions. Units
+    are packed largest-first onto the least loaded partition. Returns the row
+    order that makes each partition contiguous, and the partition bounds.
+    """
+    unit_columns = ['state', 'district'] if 'district' in keys else ['state']
+    unit = np.zeros(len(frame), dtype='int64')
+    for col in unit_columns:
+        codes, uniques = pd.factorize(frame[col])
+        # Shift so missing keys (-1) get a unit of their own
+        unit = unit * (len(uniques) + 1) + codes + 1
+    unit, _ = pd.factorize(unit)
+    sizes = np.bincount(unit)
+
+    loads = [(0, bucket) for bucket in range(workers)]
+    bucket_of_unit = np.empty(len(sizes), dtype='int64')
+    for u in np.argsort(-sizes, kind='stable'):
+        load, bucket = heapq.heappop(loads)
+        bucket_of_unit[u] = bucket
+        heapq.heappush(loads, (load + sizes[u], bucket))
+
+    bucket_of_row = bucket_of_unit[unit]
+    order = np.argsort(bucket_of_row, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(bucket_of_row, minlength=workers))])
+    return order, bounds
+
+
+def aggregate_partitioned(frame, keys, distinct=None, workers=None):
+    """
+    `_aggregate` fanned out over a process pool of `workers`.
+
+    The frame is split into key-disjoint partitions (see `_partition_rows`),
+    each partition is aggregated in its own process and the partial results
+    are concatenated in key order, which gives exactly the serial result.
+    Small frames and `workers` of None/1 run serially.
+    """
+    if not workers or workers <= 1 or len(frame) < PARALLEL_MIN_ROWS:
+        return _aggregate(frame, keys, distinct)
+
+    order, bounds = _partition_rows(frame, keys, workers)
+    ranges = [(bounds[i], bounds[i + 1]) for i in range(workers) if bounds[i + 1] > bounds[i]]
+    if 'fork' in multiprocessing.get_all_start_methods():
+        token = next(_partition_tokens)
+        with _fork_lock:
+            _partition_source[token] = (frame, order)
+            try:
+                with ProcessPoolExecutor(len(ranges), mp_context=multiprocessing.get_context('fork')) as pool:
+                    parts = list(pool.map(
+                        _aggregate_partition, [token] * len(ranges), *zip(*ranges),
+                        [keys] * len(ranges), [distinct] * len(ranges)
+                    ))
+            finally:
+                del _partition_source[token]
+    else:
+        with ProcessPoolExecutor(len(ranges)) as pool:
+            parts = list(pool.map(
+                _aggregate,
+                [frame.take(order[start:stop]) for start, stop in ranges],
+                [keys] * len(ranges), [distinct] * len(ranges)
+            ))
+
+    # Partitions are key-disjoint, so concatenation in key order is the
+    # serial groupby output
+    merged = pd.concat(parts, ignore_index=True)
+    return merged.sort_values(keys, kind='stable', ignore_index=True)
+
+
+_RAW_ROLLUPS = {
+    'daily': lambda df: _aggregate(df, ['date']),
+    'monthly': lambda df: _monthly(_aggregate(df, ['date'])),
+}
+
+# Level each region roll-up of a cube is derived from
+_CUBE_SOURCES = {'pincode': 'base', 'district': 'pincode', 'state': 'pincode'}
+
+
+def rollup(data, level, workers=None):
+    """
+    Returns the 'pincode', 'district', 'state', 'daily' or 'monthly' roll-up of `data`.
+
+    `data` may be an EnrollmentCube, in which case the stored roll-up is
+    returned, or a raw enrolment frame, which is grouped directly. With
+    `workers`, the region roll-ups are aggregated across a process pool.
+    """
+    if isinstance(data, EnrollmentCube):
+        if workers and level in ROLLUP_SPECS and level not in data.__dict__:
+            source_level = _CUBE_SOURCES[level]
+            source = data.base if source_level == 'base' else rollup(data, source_level, workers)
+            data.__dict__[level] = aggregate_partitioned(source, *ROLLUP_SPECS[level], workers)
+        return getattr(data, level)
+    if level in ROLLUP_SPECS:
+        return aggregate_partitioned(with_totals(data), *ROLLUP_SPECS[level], workers)
+    return _RAW_ROLLUPS[level](with_totals(data))
+
+
+def calendar_of(data):
+    """Calendar dimension (see utils.build_calendar) of the dates covered by `data`"""
+    if isinstance(data, EnrollmentCube):
+        return data.calendar
+    return build_calendar(data['date'])
+
+
+def _date_window(df, start, end):
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['date'] <= pd.Timestamp(end)
+    return df[mask]
+
+
+def window_rollup(data, level, start=None, end=None):
+    """
+    The 'state' or 'district' sums of `data` over the inclusive [start, end]
+    window, from the cube's TimeIndex (or by grouping a raw frame's rows in
+    the window). Without a window this is `rollup`.
+    """
+    if start is None and end is None:
+        return rollup(data, level)
+    if isinstance(data, EnrollmentCube):
+        return data.time_index.rollup(level, start, end)
+    return _aggregate(_date_window(with_totals(data), start, end), ROLLUP_SPECS[level][0])
+
+
+def window_daily(data, start=None, end=None):
+    """
+    The daily roll-up of `data` over the inclusive [start, end] window, from
+    the cube's TimeIndex (or by grouping a raw frame's rows in the window).
+    Without a window this is `rollup`.
+    """
+    if start is None and end is None:
+        return rollup(data, 'daily')
+    if isinstance(data, EnrollmentCube):
+        return data.time_index.daily_frame(start, end)
+    return _aggregate(_date_window(with_totals(data), start, end), ['date'])
+
+
+def distinct_counts(data, level, start=None, end=None, precision=DEFAULT_PRECISION):
+    """
+    Approximate distinct counts from HyperLogLog sketches (see sketch.py):
+    num_pincodes (and num_districts) per 'state' or 'district' as a frame,
+    or both for 'national' as a dict. A date window is resolved to the
+    months it overlaps, the grain the sketches are kept at.
+    """
+    if isinstance(data, EnrollmentCube):
+        table = data.sketches(precision)
+    else:
+        table = SketchTable.from_frame(data, precision)
+    if start is not None or end is not None:
+        table = table.select(start, end)
+    return table.counts(level)
+
+
+def sketched_rollup(data, level, precision=DEFAULT_PRECISION):
+    """The 'state' or 'district' roll-up with its distinct counts taken from sketches"""
+    keys, distinct = ROLLUP_SPECS[level]
+    if isinstance(data, EnrollmentCube):
+        sums = rollup(data, level).drop(columns=list(distinct.values()))
+    else:
+        # Sums only: the exact nunique is what the sketches replace
+        sums = _aggregate(with_totals(data), keys)
+    return sums.merge(distinct_counts(data, level, precision=precision), on=keys, how='left')
+
+
+def totals(data, start=None, end=None):
+    """
+    Column sums of the age, total and record counts over every row, or over
+    the rows in the inclusive [start, end] window.
+    """
+    if isinstance(data, EnrollmentCube):
+        if start is None and end is None:
+            return data.sums
+        return data.time_index.sums(start, end)[SUM_COLUMNS]
+    df = with_totals(data)
+    if start is not None or end is not None:
+        df = _date_window(df, start, end)
+    sums = df[AGE_COLUMNS + ['total_enrollments']].sum()
+    sums['records'] = len(df)
+    return sums
@@ -9,52 +9,82 @@ absolute coverage percentages.
 import pandas as pd
 import numpy as np
 
+from backends import dispatched
+from cube import (
+    EnrollmentCube, _monthly, build_enrollment_cube, calendar_of, distinct_counts, rollup, sketched_rollup,
+    totals, window_daily, window_rollup
+)
+from instrumentation import instrumented
+from sketch import DEFAULT_PRECISION
+from topk import TopK, top_bottom_k, top_k
+
+
+@instrumented
+def load_enrollment_data(filepath='data/enrolment_merged_cleaned.csv', chunksize=None, start=None, end=None,
+                         state=None):
+    """
+    Load and prepare enrollment data (served from the parquet cache when fresh).
+
+    With `chunksize`, the CSV is streamed in bounded chunks straight into an
+    EnrollmentCube instead; the raw rows are never held in memory and every
+    metric function below accepts the cube in place of the frame.
+
+    With an inclusive `start` / `end` date window or a `state`, the cube of
+    just those rows is read from the year/month partitions overlapping them
+    (see partitions.py), which are built from the CSV on first use.
+    """
+    if start is not None or end is not None or state not in (None, "All"):
+        from partitions import load_partitioned
+        return load_partitioned(filepath, start, end, state)
+    if chunksize:
+        from cube import stream_enrollment_cube
+        return stream_enrollment_cube(filepath, chunksize=chunksize)
+    from utils import read_enrollment_csv
+    return read_enrollment_csv(filepath)
+
+
+def _month_names(calendar, monthly):
+    """Month names for the (year, month) rows of a monthly series, from the calendar"""
+    months = calendar[['year', 'month', 'month_name']].drop_duplicates(['year', 'month'])
+    keys = {'year': 'int64', 'month': 'int64'}
+    labelled = monthly[['year', 'month']].astype(keys).merge(
+        months.astype(keys), on=['year', 'month'], how='left'
+    )
+    return labelled['month_name'].to_numpy()
+
+
+def _region_rollup(df, level, distinct, precision, workers=None):
+    """
+    The region roll-up with exact distinct counts (`distinct='exact'`) or
+    HyperLogLog estimates (`distinct='hll'`, see sketch.py)
+    """
+    if distinct == 'exact':
+        return rollup(df, level, workers=workers)
+    if distinct == 'hll':
+        return sketched_rollup(df, level, precision)
+    raise ValueError(f"distinct must be 'exact' or 'hll', got {distinct!r}")
+
+
+@instrumented
+@dispatched
+def calculate_enrollment_velocity(df, start=None, end=None):
+    """Calculate enrollment rates over time (over the [start, end] window if given)"""
+    # Every temporal series is derived from the daily and monthly roll-ups,
+    # labelled through the calendar dimension of the covered dates
+    windowed = start is not None or end is not None
+    daily = window_daily(df, start, end)
+    calendar = calendar_of(df)
 
-def load_enrollment_data(filepath='data/enrolment_merged_cleaned.csv'):
-    """Load and prepare enrollment data"""
-    df = pd.read_csv(filepath)
-    df['date'] = pd.to_datetime(df['date'], format='%d-%m-%Y')
-    df['year'] = df['date'].dt.year
-    df['month'] = df['date'].dt.month
-    df['month_name'] = df['date'].dt.strftime('%B')
-    df['week'] = df['date'].dt.isocalendar().week
-    df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-    return df
-
-
-def calculate_enrollment_velocity(df):
-    """Calculate enrollment rates over time"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-    # Ensure temporal columns exist
-    if 'year' not in df.columns:
-        df = df.copy()
-        df['year'] = df['date'].dt.year
-        df['month'] = df['date'].dt.month
-        df['month_name'] = df['date'].dt.strftime('%B')
-        df['week'] = df['date'].dt.isocalendar().week
-        
-    # Daily enrollment rates
-    daily = df.groupby('date').agg({
-        'age_0_5': 'sum',
-        'age_5_17': 'sum', 
-        'age_18_greater': 'sum',
-        'total_enrollments': 'sum'
-    }).reset_index()
-    
     # Monthly enrollment rates
-    monthly = df.groupby(['year', 'month', 'month_name']).agg({
-        'age_0_5': 'sum',
-        'age_5_17': 'sum',
-        'age_18_greater': 'sum',
-        'total_enrollments': 'sum'
-    }).reset_index()
+    monthly = _monthly(daily) if windowed else rollup(df, 'monthly')
+    daily = daily[['date', 'age_0_5', 'age_5_17', 'age_18_greater', 'total_enrollments']]
+    monthly = monthly[['year', 'month', 'age_0_5', 'age_5_17', 'age_18_greater', 'total_enrollments']]
+    monthly.insert(2, 'month_name', _month_names(calendar, monthly))
     monthly['year_month'] = monthly['year'].astype(str) + '-' + monthly['month'].astype(str).str.zfill(2)
     
     # Weekly enrollment rates
-    weekly = df.groupby(['year', 'week']).agg({
+    dated = daily.merge(calendar[['date', 'year', 'week']], on='date')
+    weekly = dated.groupby(['year', 'week']).agg({
         'total_enrollments': 'sum'
     }).reset_index()
     weekly['year_week'] = weekly['year'].astype(str) + '-W' + weekly['week'].astype(str).str.zfill(2)
@@ -66,23 +96,20 @@ def calculate_enrollment_velocity(df):
     }
 
 
-def calculate_state_performance(df):
-    """Calculate state performance metrics normalized by districts"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-        
-    state_stats = df.groupby('state').agg({
-        'age_0_5': 'sum',
-        'age_5_17': 'sum',
-        'age_18_greater': 'sum',
-        'total_enrollments': 'sum',
-        'district': 'nunique',  # Number of unique districts
-        'pincode': 'nunique'     # Number of unique pincodes
-    }).reset_index()
-    
-    state_stats.rename(columns={'district': 'num_districts', 'pincode': 'num_pincodes'}, inplace=True)
+@instrumented
+@dispatched
+def calculate_state_performance(df, top_n=None, distinct='exact', precision=DEFAULT_PRECISION):
+    """
+    Calculate state performance metrics normalized by districts.
+
+    With `top_n`, only the best `top_n` states are ranked and returned.
+    `distinct='hll'` estimates the district and pincode counts from
+    sketches of `precision` instead of counting them exactly.
+    """
+    state_stats = _region_rollup(df, 'state', distinct, precision)[[
+        'state', 'age_0_5', 'age_5_17', 'age_18_greater', 'total_enrollments',
+        'num_districts', 'num_pincodes'
+    ]].copy()
     
     # Performance index: enrollments per district (normalizes for state size)
     state_stats['enrollments_per_district'] = (
@@ -103,27 +130,29 @@ def calculate_state_performance(df):
     ).round(1)
     
     # Sort by performance index
+    if top_n is not None:
+        return top_k(state_stats, 'enrollments_per_district', top_n, ['state'])
     state_stats = state_stats.sort_values('enrollments_per_district', ascending=False)
     
     return state_stats
 
 
-def calculate_district_performance(df):
-    """Calculate top performing districts nationally"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-        
-    district_stats = df.groupby(['state', 'district']).agg({
-        'age_0_5': 'sum',
-        'age_5_17': 'sum',
-        'age_18_greater': 'sum',
-        'total_enrollments': 'sum',
-        'pincode': 'nunique'
-    }).reset_index()
-    
-    district_stats.rename(columns={'pincode': 'num_pincodes'}, inplace=True)
+@instrumented
+@dispatched
+def calculate_district_performance(df, workers=None, top_n=None, distinct='exact',
+                                   precision=DEFAULT_PRECISION):
+    """
+    Calculate top performing districts nationally.
+
+    `workers` aggregates state/district partitions across a process pool;
+    the output is identical to the serial path. With `top_n`, only the
+    best `top_n` districts are ranked and returned. `distinct` and
+    `precision` as in calculate_state_performance.
+    """
+    district_stats = _region_rollup(df, 'district', distinct, precision, workers)[[
+        'state', 'district', 'age_0_5', 'age_5_17', 'age_18_greater', 'total_enrollments',
+        'num_pincodes'
+    ]].copy()
     
     # Enrollments per pincode (activity density)
     district_stats['enrollments_per_pincode'] = (
@@ -131,39 +160,34 @@ def calculate_district_performance(df):
     ).round(0)
     
     # Sort by total enrollments
+    if top_n is not None:
+        return top_k(district_stats, 'total_enrollments', top_n, ['state', 'district'])
     district_stats = district_stats.sort_values('total_enrollments', ascending=False)
     
     return district_stats
 
 
+@instrumented
+@dispatched
 def calculate_temporal_trends(df):
     """Analyze temporal patterns and trends"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-    # Ensure temporal columns exist
-    if 'year' not in df.columns:
-        df = df.copy()
-        df['year'] = df['date'].dt.year
-        df['month'] = df['date'].dt.month
+    daily = rollup(df, 'daily')[['date', 'total_enrollments']]
+    calendar = calendar_of(df)
         
     # Month-over-month growth
-    monthly = df.groupby(['year', 'month']).agg({
-        'total_enrollments': 'sum'
-    }).reset_index()
+    monthly = rollup(df, 'monthly')[['year', 'month', 'total_enrollments']]
     
     monthly['prev_month'] = monthly['total_enrollments'].shift(1)
     monthly['mom_growth'] = ((monthly['total_enrollments'] - monthly['prev_month']) / 
                               monthly['prev_month'] * 100).round(1)
-    monthly['month_name'] = pd.to_datetime(monthly['month'], format='%m').dt.strftime('%B')
+    monthly['month_name'] = _month_names(calendar, monthly)
     
     # Day of week patterns
-    df['day_of_week'] = df['date'].dt.day_name()
-    dow_pattern = df.groupby('day_of_week')['total_enrollments'].sum().reset_index()
+    dated = daily.merge(calendar[['date', 'day_of_week']], on='date')
+    dow_pattern = dated.groupby('day_of_week')['total_enrollments'].sum().reset_index()
     
     # Peak enrollment periods
-    top_days = df.groupby('date')['total_enrollments'].sum().nlargest(10).reset_index()
+    top_days = daily.set_index('date')['total_enrollments'].nlargest(10).reset_index()
     
     return {
         'monthly_growth': monthly,
@@ -172,14 +196,12 @@ def calculate_temporal_trends(df):
     }
 
 
-def get_age_distribution_by_state(df):
-    """Get age group distribution for each state"""
+@instrumented
+@dispatched
+def get_age_distribution_by_state(df, start=None, end=None):
+    """Get age group distribution for each state (over the [start, end] window if given)"""
     
-    age_dist = df.groupby('state').agg({
-        'age_0_5': 'sum',
-        'age_5_17': 'sum',
-        'age_18_greater': 'sum'
-    }).reset_index()
+    age_dist = window_rollup(df, 'state', start, end)[['state', 'age_0_5', 'age_5_17', 'age_18_greater']]
     
     # Melt for easier visualization
     age_dist_melted = age_dist.melt(
@@ -192,87 +214,241 @@ def get_age_distribution_by_state(df):
     return age_dist_melted
 
 
-def get_summary_statistics(df):
-    """Calculate summary statistics for the dataset"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-        
-    total_enrollments = df['total_enrollments'].sum()
-    date_range_days = (df['date'].max() - df['date'].min()).days
+@instrumented
+@dispatched
+def get_summary_statistics(df, start=None, end=None, distinct='exact', precision=DEFAULT_PRECISION):
+    """
+    Calculate summary statistics for the dataset, or for the inclusive
+    [start, end] date window of it.
+
+    Windowed sums and state/district counts come from the cube's prefix-sum
+    time index; only the distinct pincode count needs a pass over the rows.
+    With `distinct='hll'` the district and pincode counts are estimated from
+    the cube's sketches instead (a window then counts whole months).
+    """
+    if distinct not in ('exact', 'hll'):
+        raise ValueError(f"distinct must be 'exact' or 'hll', got {distinct!r}")
+    cube = df if isinstance(df, EnrollmentCube) else build_enrollment_cube(df)
+    windowed = start is not None or end is not None
+    sums = totals(cube, start, end)
+    daily = window_daily(cube, start, end)
+
+    total_enrollments = sums['total_enrollments']
+    date_min, date_max = daily['date'].min(), daily['date'].max()
+    # An empty selection (a window with no records) has no date range
+    date_range_days = 0 if pd.isna(date_min) else (date_max - date_min).days
     avg_daily = total_enrollments / date_range_days if date_range_days > 0 else 0
-    
-    # Ensure date has required columns if missing
-    if 'year' not in df.columns:
-        df['year'] = df['date'].dt.year
         
-    num_states = df['state'].nunique()
-    num_districts = df['district'].nunique()
-    num_pincodes = df['pincode'].nunique()
+    if distinct == 'hll':
+        num_states = len(window_rollup(cube, 'state', start, end))
+        counts = distinct_counts(cube, 'national', start, end, precision)
+        num_districts, num_pincodes = counts['num_districts'], counts['num_pincodes']
+    elif windowed:
+        num_states = len(window_rollup(cube, 'state', start, end))
+        num_districts = window_rollup(cube, 'district', start, end)['district'].nunique()
+        num_pincodes = cube.filter(start=start, end=end).base['pincode'].nunique()
+    else:
+        num_states = len(cube.state)
+        num_districts = cube.district['district'].nunique()
+        num_pincodes = cube.pincode['pincode'].nunique()
     
     return {
         'total_enrollments': int(total_enrollments),
-        'age_0_5': int(df['age_0_5'].sum()),
-        'age_5_17': int(df['age_5_17'].sum()),
-        'age_18_greater': int(df['age_18_greater'].sum()),
-        'date_range': f"{df['date'].min().date()} to {df['date'].max().date()}",
+        'age_0_5': int(sums['age_0_5']),
+        'age_5_17': int(sums['age_5_17']),
+        'age_18_greater': int(sums['age_18_greater']),
+        'date_range': None if pd.isna(date_min) else f"{date_min.date()} to {date_max.date()}",
         'date_range_days': date_range_days,
         'avg_daily_enrollments': int(avg_daily),
         'num_states': num_states,
         'num_districts': num_districts,
         'num_pincodes': num_pincodes,
-        'num_records': len(df)
+        'num_records': int(sums['records'])
     }
 
 
-def calculate_population_coverage(df, pop_df):
-    """Calculates enrollment relative to population for each state"""
-    from utils import normalize_state_names
-    df = normalize_state_names(df.copy())
-    pop_df = normalize_state_names(pop_df.copy())
-    
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-        
-    state_totals = df.groupby('state')['total_enrollments'].sum().reset_index()
+def _trailing_sums(cumulative, window, lag=0):
+    """
+    Sums over the `window` days ending `lag` days before each day, from a
+    (regions, days + 1) cumulative array; NaN where the window is not full
+    """
+    days = cumulative.shape[1] - 1
+    sums = np.full((cumulative.shape[0], days), np.nan)
+    if window + lag <= days:
+        sums[:, window - 1 + lag:] = cumulative[:, window:days + 1 - lag] - cumulative[:, :days + 1 - lag - window]
+    return sums
+
+
+@instrumented
+def calculate_rolling_velocity(df, level='state', windows=(7, 28), z_window=28, threshold=3.0):
+    """
+    Rolling enrollment velocity and spike/drop detection for every region of
+    `level` ('national', 'state' or 'district') in one vectorized pass.
+
+    The daily totals are laid out as a dense (region x calendar day) matrix,
+    with days without records as zeros, and every trailing-window statistic
+    is the difference of two columns of its cumulative sums, so no region is
+    rolled on its own. Velocity is the mean daily enrollments over each of
+    `windows` days; a day's z-score compares it with the mean and standard
+    deviation of the `z_window` days before it. After a flat baseline (e.g.
+    an outage, or the days before a drive starts) any change is an
+    infinite z-score, so recoveries and first days are flagged too.
+
+    Returns a dict with
+    - 'velocity': one row per region and day with total_enrollments,
+      velocity_<w>d per window, baseline and z_score (NaN until the window is full)
+    - 'anomalies': the days with |z_score| >= `threshold`, labelled 'spike'
+      or 'drop', largest |z_score| first
+    """
+    cube = df if isinstance(df, EnrollmentCube) else build_enrollment_cube(df)
+    index = cube.time_index
+    keys, daily = index.daily(level)
+    key_columns = {'national': [], 'state': ['state'], 'district': ['state', 'district']}[level]
+    regions = pd.DataFrame([key if isinstance(key, tuple) else (key,) for key in keys], columns=key_columns or ['_'])
+    known = regions.notna().all(axis=1).to_numpy() if key_columns else np.ones(len(keys), dtype=bool)
+    regions, daily = regions[known][key_columns].reset_index(drop=True), daily[known]
+
+    # Calendar days, so a day without a single record counts as a zero
+    calendar = pd.date_range(index.dates.min(), index.dates.max(), freq='D') if len(index.dates) else index.dates
+    dense = np.zeros((len(regions), len(calendar)), dtype='int64')
+    dense[:, calendar.get_indexer(index.dates)] = daily
+
+    # Exact integer prefix sums of the counts and of their squares
+    cumulative = np.zeros((len(regions), len(calendar) + 1), dtype='int64')
+    np.cumsum(dense, axis=1, out=cumulative[:, 1:])
+    cumulative_sq = np.zeros_like(cumulative)
+    np.cumsum(dense * dense, axis=1, out=cumulative_sq[:, 1:])
+
+    velocity = pd.DataFrame({
+        **{col: np.repeat(regions[col].to_numpy(), len(calendar)) for col in key_columns},
+        'date': np.tile(calendar, len(regions)),
+        'total_enrollments': dense.ravel(),
+    })
+    for window in windows:
+        velocity[f'velocity_{window}d'] = (_trailing_sums(cumulative, window) / window).ravel()
+
+    # Baseline of the z_window days before each day, so a spike does not
+    # raise its own baseline
+    sums = _trailing_sums(cumulative, z_window, lag=1)
+    squares = _trailing_sums(cumulative_sq, z_window, lag=1)
+    baseline = sums / z_window
+    variance = (z_window * squares - sums * sums) / (z_window * (z_window - 1))
+    deviation = dense - baseline
+    z_score = np.full(deviation.shape, np.nan)
+    spread = variance > 0
+    z_score[spread] = deviation[spread] / np.sqrt(variance[spread])
+    # Integer sums make a flat baseline's variance exactly 0; it stays NaN
+    # only while the day matches it
+    flat = (variance == 0) & (deviation != 0)
+    z_score[flat] = np.copysign(np.inf, deviation[flat])
+    velocity['baseline'] = baseline.ravel()
+    velocity['z_score'] = z_score.ravel()
+
+    anomalies = velocity[velocity['z_score'].abs() >= threshold].copy()
+    anomalies['kind'] = np.where(anomalies['z_score'] > 0, 'spike', 'drop')
+    anomalies = anomalies.iloc[np.argsort(-anomalies['z_score'].abs().to_numpy(), kind='stable')]
+    return {
+        'velocity': velocity,
+        'anomalies': anomalies[key_columns + ['date', 'total_enrollments', 'baseline', 'z_score', 'kind']]
+            .reset_index(drop=True),
+    }
+
+
+def _population_coverage(df, pop_df, start=None, end=None):
+    # State names are canonical in both frames since ingest
+    state_totals = window_rollup(df, 'state', start, end)[['state', 'total_enrollments']]
     merged = pd.merge(state_totals, pop_df, on='state', how='inner')
     
     # Calculate ratio (enrollments per person)
     merged['enrollment_ratio'] = merged['total_enrollments'] / merged['Population']
     # Calculate enrollments per 100k people for better scale
     merged['enrollments_per_100k'] = (merged['total_enrollments'] / merged['Population']) * 100000
-    
-    return merged.sort_values('enrollment_ratio', ascending=False)
+    return merged
 
 
-def calculate_adult_enrollment_by_state(df):
-    """Calculates total adult enrollment by state"""
-    from utils import normalize_state_names
-    df = normalize_state_names(df.copy())
-    
-    adult_stats = df.groupby('state')['age_18_greater'].sum().reset_index()
+@instrumented
+def calculate_population_coverage(df, pop_df, start=None, end=None):
+    """Calculates enrollment relative to population for each state (over the [start, end] window if given)"""
+    return _population_coverage(df, pop_df, start, end).sort_values('enrollment_ratio', ascending=False)
+
+
+@instrumented
+def get_coverage_extremes(df, pop_df, n=15, start=None, end=None):
+    """
+    Leaders and laggards of population coverage in one pass.
+
+    Returns the `n` states with the highest enrollment ratio (highest first)
+    and the `n` with the lowest, ordered as the tail of the full ranking.
+    """
+    coverage = _population_coverage(df, pop_df, start, end)
+    leaders, laggards = top_bottom_k(coverage, 'enrollment_ratio', n, ['state'])
+    return leaders, laggards.iloc[::-1]
+
+
+@instrumented
+@dispatched
+def calculate_adult_enrollment_by_state(df, start=None, end=None):
+    """Calculates total adult enrollment by state (over the [start, end] window if given)"""
+    adult_stats = window_rollup(df, 'state', start, end)[['state', 'age_18_greater']]
     return adult_stats.sort_values('age_18_greater', ascending=False)
 
 
-def get_top_pincodes(df, top_n=50):
-    """Get top performing pincodes by enrollment volume"""
-    # Ensure total_enrollments exists
-    if 'total_enrollments' not in df.columns:
-        df = df.copy()
-        df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
-        
-    pincode_stats = df.groupby(['state', 'district', 'pincode']).agg({
-        'total_enrollments': 'sum',
-        'age_0_5': 'sum',
-        'age_5_17': 'sum',
-        'age_18_greater': 'sum'
-    }).reset_index()
-    
-    pincode_stats = pincode_stats.sort_values('total_enrollments', ascending=False).head(top_n)
-    
-    return pincode_stats
+@instrumented
+def fit_birth_regression(df, birth_df):
+    """
+    Ordinary least squares of new child (0-5) enrollments on annual births
+    across states, in closed form.
+
+    Returns a dict with `slope`, `intercept`, `r_squared` and `points`, one
+    row per state with its births, enrollments, fitted value and residual
+    (negative = below the line). With fewer than two states, or no spread
+    in births, the fit is undefined and reported as NaN.
+    """
+    enrol_state = rollup(df, 'state')[['state', 'age_0_5']].rename(columns={'age_0_5': 'enrolled_0_5'})
+    points = pd.merge(birth_df[['state', 'total_births']], enrol_state, on='state', how='inner')
+
+    x = points['total_births'].to_numpy(dtype='float64')
+    y = points['enrolled_0_5'].to_numpy(dtype='float64')
+    x_dev = x - x.mean() if len(x) else x
+    sxx = (x_dev ** 2).sum()
+    if len(x) < 2 or sxx == 0:
+        slope = intercept = r_squared = np.nan
+        points['predicted'] = np.nan
+    else:
+        slope = (x_dev * (y - y.mean())).sum() / sxx
+        intercept = y.mean() - slope * x.mean()
+        points['predicted'] = intercept + slope * x
+        ss_res = ((y - points['predicted']) ** 2).sum()
+        ss_tot = ((y - y.mean()) ** 2).sum()
+        r_squared = 1 - ss_res / ss_tot if ss_tot > 0 else 1.0
+    points['residual'] = points['enrolled_0_5'] - points['predicted']
+    # Shortfall relative to what the state's births predict
+    points['residual_pct'] = (points['residual'] / points['predicted'] * 100).round(1)
+
+    return {'slope': slope, 'intercept': intercept, 'r_squared': r_squared, 'points': points}
+
+
+@instrumented
+def get_priority_zones(df, birth_df, n=10):
+    """
+    States furthest below the enrollments-vs-births regression line, most
+    negative residual first: the priority zones for newborn enrollment.
+    """
+    points = fit_birth_regression(df, birth_df)['points']
+    board = TopK(n, 'residual', ['state'], largest=False).push(points[points['residual'] < 0])
+    return board.bottom().reset_index(drop=True)
+
+
+@instrumented
+@dispatched
+def get_top_pincodes(df, top_n=50, workers=None):
+    """Get top performing pincodes by enrollment volume (`workers` as in calculate_district_performance)"""
+    pincode_stats = rollup(df, 'pincode', workers=workers)[[
+        'state', 'district', 'pincode', 'total_enrollments', 'age_0_5', 'age_5_17', 'age_18_greater'
+    ]]
+    
+    # Bounded top-k instead of sorting every pincode
+    return top_k(pincode_stats, 'total_enrollments', top_n, ['state', 'district', 'pincode'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+"""
+Process-wide Figure Cache
+
+Building and serializing plotly figures dominates a dashboard rerun, and the
+same (chart, filter, data version) combinations are asked for again and
+again, by every session. `FigureCache` keeps built figures in a
+least-recently-used cache bounded by their serialized size. The module-level
+`figure_cache` is shared by all Streamlit sessions of the process, since
+Streamlit imports modules once and reruns only the app script.
+
+    fig = figure_cache.get_or_build(('monthly_velocity', region, version), build)
+    figure_cache.stats()  # hits, misses, evictions, entries, bytes
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_MB_ENV = "UIDAI_FIGURE_CACHE_MB"
+DEFAULT_CACHE_MB = 256
+
+
+def figure_bytes(value):
+    """Serialized size of a figure or table (or of a tuple of them)"""
+    if isinstance(value, tuple):
+        return sum(figure_bytes(item) for item in value)
+    if isinstance(value, list):
+        # Table rows as read back from a batch snapshot
+        return len(json.dumps(value))
+    return len(value.to_json())
+
+
+class FigureCache:
+    """
+    Thread-safe LRU cache of built figures, bounded by `max_bytes` of figure
+    JSON; `size` measures other kinds of values
+    """
+
+    def __init__(self, max_bytes, size=figure_bytes):
+        self.max_bytes = max_bytes
+        self._size = size
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """The cached value for `key` (marked as recently used), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self._size(value)
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Would evict everything else and still not fit
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """
+        The cached value for `key`, or `build()` stored under it.
+
+        Two sessions missing on the same key at once may both build it; the
+        figures are equal, so the second simply replaces the first.
+        """
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+figure_cache = FigureCache(int(float(os.environ.get(CACHE_MB_ENV, DEFAULT_CACHE_MB)) * 1e6))
@@ -0,0 +1,201 @@
+"""
+Hot-path Instrumentation
+
+Opt-in timing of the loaders, metric functions and chart builders. Functions
+decorated with `@instrumented` record their wall time, rows in and out and
+peak traced memory while a rerun is being recorded on the current thread
+(Streamlit runs each session's script on its own thread). Outside a recorded
+rerun the decorator costs one attribute lookup.
+
+tracemalloc is process-wide, so only one recorded rerun at a time traces
+memory; reruns recorded alongside it get timings and row counts only.
+
+    start_rerun()
+    try:
+        ...                       # run the dashboard script
+    finally:
+        records = finish_rerun()  # list of dicts, also written as JSON if asked
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+ENV_FLAG = "UIDAI_INSTRUMENT"
+LOG_DIR_ENV = "UIDAI_INSTRUMENT_LOG"
+
+_local = threading.local()
+
+# The recorder owning tracemalloc, and whether it started tracing itself
+_tracing_lock = threading.Lock()
+_tracing = {'owner': None, 'started': False}
+
+
+def enabled_by_env():
+    """True when instrumentation is switched on through the environment"""
+    return os.environ.get(ENV_FLAG, "").lower() in ("1", "true", "yes")
+
+
+def figure_points(fig):
+    """Points across all traces of a plotly figure (pies carry values, not x)"""
+    points = 0
+    for trace in fig.data:
+        values = trace['x'] if 'x' in trace else trace['values'] if 'values' in trace else None
+        points += len(values) if values is not None else 0
+    return points
+
+
+def _row_count(obj):
+    """
+    Rows represented by an argument or result (points for a figure), or
+    None if it has no row notion
+    """
+    from cube import EnrollmentCube
+    if isinstance(obj, tuple):
+        counts = [c for c in (_row_count(item) for item in obj) if c is not None]
+        return sum(counts) if counts else None
+    if isinstance(obj, dict):
+        counts = [c for c in (_row_count(item) for item in obj.values()) if c is not None]
+        return sum(counts) if counts else None
+    if isinstance(obj, EnrollmentCube):
+        # The raw records a cube summarizes, without loading its base
+        return int(obj.sums['records'])
+    if hasattr(obj, 'shape') and hasattr(obj, 'columns'):
+        return int(obj.shape[0])
+    if hasattr(obj, 'data') and hasattr(obj, 'layout'):
+        return figure_points(obj)
+    return None
+
+
+class _Recorder:
+    def __init__(self, trace_memory):
+        self.records = []
+        self.depth = 0
+        self.trace_memory = trace_memory
+        # Peak seen by each open call; reset_peak() is shared, so outer
+        # frames carry the inner peaks forward themselves
+        self.peaks = []
+        self.started = time.perf_counter()
+
+
+def _release_tracing(recorder):
+    with _tracing_lock:
+        if _tracing['owner'] is recorder:
+            if _tracing['started']:
+                tracemalloc.stop()
+            _tracing.update(owner=None, started=False)
+
+
+def start_rerun(trace_memory=True):
+    """
+    Begins recording instrumented calls made on this thread; memory is
+    traced too unless another recorded rerun is tracing it already
+    """
+    stale = getattr(_local, 'recorder', None)
+    if stale is not None:
+        # Left behind by a rerun that never reached finish_rerun
+        _release_tracing(stale)
+    recorder = _Recorder(trace_memory=False)
+    if trace_memory:
+        with _tracing_lock:
+            if _tracing['owner'] is None:
+                started = not tracemalloc.is_tracing()
+                if started:
+                    tracemalloc.start()
+                _tracing.update(owner=recorder, started=started)
+                recorder.trace_memory = True
+    _local.recorder = recorder
+
+
+def is_recording():
+    return getattr(_local, 'recorder', None) is not None
+
+
+@contextmanager
+def _measure(name, kind, rows_in=None):
+    recorder = getattr(_local, 'recorder', None)
+    if recorder is None:
+        yield {}
+        return
+
+    entry = {'name': name, 'kind': kind, 'depth': recorder.depth, 'rows_in': rows_in}
+    start = time.perf_counter()
+    entry['start'] = round(start - recorder.started, 6)
+    trace = recorder.trace_memory and tracemalloc.is_tracing()
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        if recorder.peaks:
+            recorder.peaks[-1] = max(recorder.peaks[-1], peak)
+        tracemalloc.reset_peak()
+        recorder.peaks.append(current)
+        baseline = current
+
+    recorder.depth += 1
+    try:
+        yield entry
+    finally:
+        entry['seconds'] = round(time.perf_counter() - start, 6)
+        recorder.depth -= 1
+        if trace:
+            peak = max(recorder.peaks.pop(), tracemalloc.get_traced_memory()[1])
+            entry['peak_mb'] = round((peak - baseline) / 1e6, 3)
+            if recorder.peaks:
+                recorder.peaks[-1] = max(recorder.peaks[-1], peak)
+        recorder.records.append(entry)
+
+
+def instrumented(func):
+    """Records the decorated function's calls while a rerun is being recorded"""
+    name = f"{func.__module__}.{func.__name__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'recorder', None) is None:
+            return func(*args, **kwargs)
+        with _measure(name, 'call', _row_count(args[0]) if args else None) as entry:
+            result = func(*args, **kwargs)
+            entry['rows_out'] = _row_count(result)
+            return result
+
+    return wrapper
+
+
+@contextmanager
+def timed_block(name):
+    """Records an arbitrary block, e.g. figure serialization in the app"""
+    with _measure(name, 'block'):
+        yield
+
+
+def finish_rerun(log_dir=None):
+    """
+    Stops recording and returns the rerun's records in call order; without
+    a recorded rerun on this thread, returns [].
+
+    With `log_dir` (or the UIDAI_INSTRUMENT_LOG environment variable) the
+    records are also written there as one JSON file per rerun.
+    """
+    recorder = getattr(_local, 'recorder', None)
+    _local.recorder = None
+    if recorder is None:
+        return []
+
+    _release_tracing(recorder)
+
+    # Records are appended as calls exit; order them by start for reading
+    records = sorted(recorder.records, key=lambda r: r['start'])
+    log_dir = log_dir or os.environ.get(LOG_DIR_ENV)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        with open(os.path.join(log_dir, f"rerun-{stamp}.json"), "w") as f:
+            json.dump({
+                'total_seconds': round(time.perf_counter() - recorder.started, 6),
+                'records': records,
+            }, f, indent=2)
+    return records
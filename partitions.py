@@ -0,0 +1,268 @@
+"""
+Year/month-partitioned Enrolment Store
+
+Lays the cube base (summed counts at state, district, pincode, date grain)
+out on disk in one parquet file per year-month, and optionally per state
+within the month:
+
+    data/.partitions/manifest.json
+    data/.partitions/year=2025/month=03/part-v1.parquet
+    data/.partitions/year=2025/month=03/state=Tamil_Nadu/part-v1.parquet   (by_state)
+
+The manifest lists every partition with its year, month (and state), row
+and record counts and min/max date, so a query for one month or one state
+reads only the files that overlap it, however much history accumulates.
+Appending a file rewrites only the partitions its dates fall in; like the
+aggregate store, the manifest switch is the commit point and the files the
+previous version still needs are only deleted at the commit after it.
+Builds and appends hold the store's lock file, so several workers noticing
+a changed CSV at once rebuild it one after the other (the later ones find
+it current and skip).
+
+    cube = load_partitioned(start='2025-03-01', end='2025-03-31', state='Kerala')
+    get_summary_statistics(cube)
+"""
+
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from cube import GRAIN, SUM_COLUMNS, EnrollmentCube, _compact, stream_enrollment_cube
+from instrumentation import instrumented
+from store import _write_frame, _write_manifest
+from utils import enforce_enrollment_schema, read_parquet_frame
+from versions import ENROLMENT_CSV, read_manifest, source_fingerprint
+
+PARTITION_DIR = "data/.partitions"
+PARTITION_FORMAT = 1
+LOCK_FILE = ".lock"
+
+
+def _state_slug(state):
+    """File-system safe directory name of a state (the manifest keeps the real name)"""
+    if pd.isna(state):
+        return "__missing__"
+    return re.sub(r'[^0-9A-Za-z]+', '_', str(state)).strip('_')
+
+
+def _partition_path(year, month, state, version, by_state):
+    month_dir = "year=unknown" if year is None else os.path.join(f"year={year}", f"month={month:02d}")
+    if by_state:
+        month_dir = os.path.join(month_dir, f"state={_state_slug(state)}")
+    return os.path.join(month_dir, f"part-v{version}.parquet")
+
+
+def _split(base, by_state):
+    """Yields (year, month, state, frame) for each partition of a cube base"""
+    dates = base['date']
+    keys = [dates.dt.year.rename('year'), dates.dt.month.rename('month')]
+    if by_state:
+        keys.append(base['state'])
+    for key, frame in base.groupby(keys, observed=True, dropna=False, sort=True):
+        year, month = key[0], key[1]
+        if pd.isna(year):
+            year = month = None
+        else:
+            year, month = int(year), int(month)
+        yield year, month, (key[2] if by_state else None), frame
+
+
+def _describe(year, month, state, frame, path):
+    dates = frame['date'].dropna()
+    return {
+        'path': path,
+        'year': year,
+        'month': month,
+        'state': None if pd.isna(state) else str(state),
+        'rows': len(frame),
+        'records': int(frame['records'].sum()),
+        'min_date': dates.min().strftime('%Y-%m-%d') if len(dates) else None,
+        'max_date': dates.max().strftime('%Y-%m-%d') if len(dates) else None,
+    }
+
+
+@contextmanager
+def _writer_lock(partition_dir):
+    """Holds the store's lock file, so one process at a time builds or appends"""
+    os.makedirs(partition_dir, exist_ok=True)
+    with open(os.path.join(partition_dir, LOCK_FILE), "w") as f:
+        try:
+            import fcntl
+        except ImportError:
+            # No flock (Windows): writers are not serialized
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_partitions(base, partition_dir, manifest, replaced=()):
+    """
+    Writes `base` as the partitions of the next version, keeping the
+    manifest entries not in `replaced`, and switches the manifest to them.
+    The `replaced` files stay until the next commit, for readers of the
+    previous version; those replaced at the previous commit go now.
+    """
+    version = manifest.get('version', 0) + 1
+    by_state = manifest['by_state']
+    entries = [entry for entry in manifest.get('partitions', []) if entry['path'] not in replaced]
+    for year, month, state, frame in _split(base, by_state):
+        path = _partition_path(year, month, state, version, by_state)
+        os.makedirs(os.path.dirname(os.path.join(partition_dir, path)), exist_ok=True)
+        _write_frame(frame.reset_index(drop=True), os.path.join(partition_dir, path))
+        entries.append(_describe(year, month, state, frame, path))
+
+    stale = manifest.get('previous_files', [])
+    manifest.update({
+        'format': PARTITION_FORMAT,
+        'version': version,
+        'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'partitions': sorted(entries, key=lambda e: (e['year'] or 0, e['month'] or 0, e['state'] or '')),
+        'previous_files': list(replaced),
+    })
+    _write_manifest(manifest, partition_dir)
+
+    for path in stale:
+        try:
+            os.remove(os.path.join(partition_dir, path))
+        except FileNotFoundError:
+            pass
+    return version
+
+
+def build_partitions(filepath=ENROLMENT_CSV, partition_dir=PARTITION_DIR, by_state=False, chunksize=500_000):
+    """
+    Creates (or replaces) the partitioned store from a full enrolment CSV,
+    partitioned by year-month and, with `by_state`, by state within the month.
+
+    Returns the new version number.
+    """
+    with _writer_lock(partition_dir):
+        return _build_partitions(filepath, partition_dir, by_state, chunksize)
+
+
+def _build_partitions(filepath, partition_dir, by_state=False, chunksize=500_000):
+    previous = read_manifest(partition_dir) or {}
+    replaced = [entry['path'] for entry in previous.get('partitions', [])]
+    cube = stream_enrollment_cube(filepath, chunksize=chunksize)
+    manifest = {
+        'version': previous.get('version', 0),
+        'by_state': by_state,
+        'sources': [{'path': os.path.abspath(filepath), 'fingerprint': source_fingerprint(filepath)}],
+        'previous_files': previous.get('previous_files', []),
+    }
+    return _write_partitions(cube.base, partition_dir, manifest, replaced)
+
+
+def append_partitions(delta_path, partition_dir=PARTITION_DIR, chunksize=500_000):
+    """
+    Merges a new enrolment file into the partitions its dates fall in,
+    leaving every other partition untouched. A file that was already
+    ingested is skipped. Returns the (possibly unchanged) version number.
+    """
+    with _writer_lock(partition_dir):
+        return _append_partitions(delta_path, partition_dir, chunksize)
+
+
+def _append_partitions(delta_path, partition_dir, chunksize):
+    manifest = read_manifest(partition_dir)
+    if manifest is None:
+        return _build_partitions(delta_path, partition_dir, chunksize=chunksize)
+
+    fingerprint = source_fingerprint(delta_path)
+    if any(src['fingerprint'] == fingerprint for src in manifest['sources']):
+        return manifest['version']
+
+    delta = stream_enrollment_cube(delta_path, chunksize=chunksize).base
+    by_state = manifest['by_state']
+    touched = {
+        (year, month, None if pd.isna(state) else str(state)) for year, month, state, _ in _split(delta, by_state)
+    }
+    replaced = [
+        entry for entry in manifest['partitions']
+        if (entry['year'], entry['month'], entry['state'] if by_state else None) in touched
+    ]
+    # Keys seen in both the history and the delta are re-summed
+    base = _compact([_read(partition_dir, entry) for entry in replaced] + [delta])
+
+    manifest['sources'].append({'path': os.path.abspath(delta_path), 'fingerprint': fingerprint})
+    return _write_partitions(base, partition_dir, manifest, [entry['path'] for entry in replaced])
+
+
+def _read(partition_dir, entry):
+    return read_parquet_frame(os.path.join(partition_dir, entry['path']))
+
+
+def prune(manifest, start=None, end=None, state=None):
+    """
+    The manifest entries of the partitions overlapping the inclusive
+    [start, end] window and, for a store partitioned by state, `state`.
+    Partitions of undated rows only match when there is no window.
+    """
+    start = None if start is None else pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = None if end is None else pd.Timestamp(end).strftime('%Y-%m-%d')
+    selected = []
+    for entry in manifest['partitions']:
+        if start is not None or end is not None:
+            if entry['min_date'] is None:
+                continue
+            if start is not None and entry['max_date'] < start:
+                continue
+            if end is not None and entry['min_date'] > end:
+                continue
+        if state not in (None, "All") and manifest['by_state'] and entry['state'] != state:
+            continue
+        selected.append(entry)
+    return selected
+
+
+def partitions_current(filepath=ENROLMENT_CSV, partition_dir=PARTITION_DIR):
+    """Whether the partitioned store has ingested the current contents of `filepath`"""
+    manifest = read_manifest(partition_dir)
+    if manifest is None or manifest.get('format') != PARTITION_FORMAT:
+        return False
+    fingerprint = source_fingerprint(filepath)
+    return any(src['fingerprint'] == fingerprint for src in manifest['sources'])
+
+
+@instrumented
+def load_partitioned(filepath=ENROLMENT_CSV, start=None, end=None, state=None, partition_dir=PARTITION_DIR):
+    """
+    An EnrollmentCube of the rows in the inclusive [start, end] window and
+    `state` ("All" or None for every state), read from the overlapping
+    partitions only. The partitions are (re)built from `filepath` first if
+    they have not ingested its current contents.
+    """
+    if not partitions_current(filepath, partition_dir):
+        with _writer_lock(partition_dir):
+            # Another worker may have rebuilt them while this one waited
+            if not partitions_current(filepath, partition_dir):
+                _build_partitions(filepath, partition_dir)
+    manifest = read_manifest(partition_dir)
+
+    selected = prune(manifest, start, end, state)
+    if selected:
+        base = pd.concat([_read(partition_dir, entry) for entry in selected], ignore_index=True)
+    else:
+        base = pd.DataFrame(columns=GRAIN + SUM_COLUMNS)
+    base = enforce_enrollment_schema(base)
+    cube = EnrollmentCube(base, version=f"parts-v{manifest['version']}")
+    # Partitions bound the read to whole months (and states); the exact
+    # window and state are cut within them
+    return cube.filter(state, start, end)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            print(f"Appending {path}... version {append_partitions(path)}")
+    else:
+        print(f"Partitioning {ENROLMENT_CSV}... version {build_partitions()}")
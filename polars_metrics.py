@@ -0,0 +1,238 @@
+"""
+Polars Backend for the Enrollment Metrics
+
+Multi-threaded implementations of the row-scanning functions of
+`enhanced_metrics`, used while `backends.set_backend('polars')` is active.
+Each takes the same arguments and returns the same pandas frames and dicts
+as the pandas reference. The rows of a prepared enrolment frame are
+converted to polars once per frame, and every result is one lazy query, so
+projections are pushed down and the grouping runs on all cores without
+intermediate copies.
+
+EnrollmentCube inputs stay on the reference: it answers from the cube's
+cached roll-ups and time index, which beats rescanning the base (at 1M rows,
+0.11s against 0.20s for the state ranking), and converting the base would
+keep a second copy of a cube that may be a zero-copy shared snapshot.
+Functions working on the small state roll-ups (population coverage, the
+birth regression) stay on the reference too.
+"""
+
+import weakref
+
+import pandas as pd
+import polars as pl
+
+from backends import BackendUnsupported
+from cube import AGE_COLUMNS, EnrollmentCube
+
+SUM_COLUMNS = AGE_COLUMNS + ['total_enrollments']
+KEY_COLUMNS = ['state', 'district', 'pincode', 'date']
+
+# id(frame) -> (weak reference, polars rows); entries leave with their frame
+_converted = {}
+
+
+def to_polars(frame):
+    """
+    The enrolment rows of `frame` as a polars frame of KEY_COLUMNS,
+    SUM_COLUMNS and `records`, converted once per frame
+    """
+    key = id(frame)
+    cached = _converted.get(key)
+    if cached is not None and cached[0]() is frame:
+        return cached[1]
+
+    columns = [col for col in KEY_COLUMNS + SUM_COLUMNS + ['records'] if col in frame.columns]
+    rows = pl.from_pandas(frame[columns]).with_columns(
+        pl.col('state', 'district').cast(pl.String),
+        pl.col(AGE_COLUMNS).cast(pl.Int64),
+    )
+    if 'total_enrollments' in columns:
+        rows = rows.with_columns(pl.col('total_enrollments').cast(pl.Int64))
+    else:
+        rows = rows.with_columns(pl.sum_horizontal(AGE_COLUMNS).alias('total_enrollments'))
+    # Raw rows count once each; pre-aggregated rows carry their record count
+    if 'records' in columns:
+        rows = rows.with_columns(pl.col('records').cast(pl.Int64))
+    else:
+        rows = rows.with_columns(pl.lit(1, dtype=pl.Int64).alias('records'))
+
+    _converted[key] = (weakref.ref(frame, lambda _: _converted.pop(key, None)), rows)
+    return rows
+
+
+def _rows(df, start=None, end=None):
+    """Lazy rows of `df`, restricted to the inclusive [start, end] window if given"""
+    if isinstance(df, EnrollmentCube):
+        raise BackendUnsupported("Cubes are answered from their roll-ups by the reference backend")
+    rows = to_polars(df).lazy()
+    if start is not None:
+        rows = rows.filter(pl.col('date') >= pd.Timestamp(start).to_pydatetime())
+    if end is not None:
+        rows = rows.filter(pl.col('date') <= pd.Timestamp(end).to_pydatetime())
+    return rows
+
+
+def _sums(columns=SUM_COLUMNS):
+    return [pl.col(col).sum() for col in columns]
+
+
+def _round(expr, decimals):
+    # numpy's rounding, as pandas' .round uses
+    return expr.round(decimals, mode='half_to_even')
+
+
+def _ranked(frame, column, keys, top_n):
+    """Sorted by `column` descending; with `top_n`, the top_k ranking (ties by keys ascending)"""
+    if top_n is None:
+        return frame.sort(column, descending=True, maintain_order=True)
+    return frame.filter(~pl.col(column).cast(pl.Float64).is_nan()).sort(
+        [column] + keys, descending=[True] + [False] * len(keys)
+    ).head(top_n)
+
+
+def _check_distinct(distinct):
+    if distinct == 'hll':
+        raise BackendUnsupported("HyperLogLog distinct counts are computed by the reference backend")
+    if distinct != 'exact':
+        raise ValueError(f"distinct must be 'exact' or 'hll', got {distinct!r}")
+
+
+def calculate_enrollment_velocity(df, start=None, end=None):
+    daily = _rows(df, start, end).filter(pl.col('date').is_not_null()).group_by('date').agg(_sums()).sort('date')
+    monthly = daily.group_by(
+        pl.col('date').dt.year().alias('year'), pl.col('date').dt.month().alias('month')
+    ).agg(
+        pl.col('date').first().dt.strftime('%B').alias('month_name'), *_sums()
+    ).sort('year', 'month').with_columns(
+        (pl.col('year').cast(pl.String) + '-' + pl.col('month').cast(pl.String).str.zfill(2)).alias('year_month')
+    )
+    weekly = daily.group_by(
+        pl.col('date').dt.year().alias('year'), pl.col('date').dt.week().alias('week')
+    ).agg(pl.col('total_enrollments').sum()).sort('year', 'week').with_columns(
+        (pl.col('year').cast(pl.String) + '-W' + pl.col('week').cast(pl.String).str.zfill(2)).alias('year_week')
+    )
+    # One optimized plan; the daily series is computed once for all three
+    daily, monthly, weekly = pl.collect_all([daily, monthly, weekly])
+    return {'daily': daily.to_pandas(), 'monthly': monthly.to_pandas(), 'weekly': weekly.to_pandas()}
+
+
+def calculate_state_performance(df, top_n=None, distinct='exact', precision=None):
+    _check_distinct(distinct)
+    state_stats = _rows(df).filter(pl.col('state').is_not_null()).group_by('state').agg(
+        *_sums(),
+        pl.col('district').drop_nulls().n_unique().alias('num_districts'),
+        pl.col('pincode').drop_nulls().n_unique().alias('num_pincodes'),
+    ).with_columns(
+        _round(pl.col('total_enrollments') / pl.col('num_districts'), 0).alias('enrollments_per_district'),
+        _round(pl.col('age_0_5') / pl.col('total_enrollments') * 100, 1).alias('pct_children_0_5'),
+        _round(pl.col('age_5_17') / pl.col('total_enrollments') * 100, 1).alias('pct_children_5_17'),
+        _round(pl.col('age_18_greater') / pl.col('total_enrollments') * 100, 1).alias('pct_adults'),
+    ).sort('state')
+    return _ranked(state_stats, 'enrollments_per_district', ['state'], top_n).collect().to_pandas()
+
+
+def calculate_district_performance(df, workers=None, top_n=None, distinct='exact', precision=None):
+    # `workers` is moot: polars already spreads the grouping across cores
+    _check_distinct(distinct)
+    district_stats = _rows(df).filter(
+        pl.col('state').is_not_null() & pl.col('district').is_not_null()
+    ).group_by('state', 'district').agg(
+        *_sums(), pl.col('pincode').drop_nulls().n_unique().alias('num_pincodes')
+    ).with_columns(
+        _round(pl.col('total_enrollments') / pl.col('num_pincodes'), 0).alias('enrollments_per_pincode')
+    ).sort('state', 'district')
+    return _ranked(district_stats, 'total_enrollments', ['state', 'district'], top_n).collect().to_pandas()
+
+
+def calculate_temporal_trends(df):
+    daily = _rows(df).filter(pl.col('date').is_not_null()).group_by('date').agg(
+        pl.col('total_enrollments').sum()
+    ).sort('date')
+    monthly = daily.group_by(
+        pl.col('date').dt.year().alias('year'), pl.col('date').dt.month().alias('month')
+    ).agg(
+        pl.col('total_enrollments').sum(), pl.col('date').first().dt.strftime('%B').alias('month_name')
+    ).sort('year', 'month').with_columns(
+        pl.col('total_enrollments').shift(1).alias('prev_month')
+    ).with_columns(
+        _round(
+            (pl.col('total_enrollments') - pl.col('prev_month')) / pl.col('prev_month') * 100, 1
+        ).alias('mom_growth')
+    ).select('year', 'month', 'total_enrollments', 'prev_month', 'mom_growth', 'month_name')
+    dow_pattern = daily.group_by(pl.col('date').dt.strftime('%A').alias('day_of_week')).agg(
+        pl.col('total_enrollments').sum()
+    ).sort('day_of_week')
+    peak_days = daily.sort(['total_enrollments', 'date'], descending=[True, False]).head(10)
+
+    monthly, dow_pattern, peak_days = pl.collect_all([monthly, dow_pattern, peak_days])
+    return {
+        'monthly_growth': monthly.to_pandas(),
+        'day_of_week_pattern': dow_pattern.to_pandas(),
+        'peak_days': peak_days.to_pandas(),
+    }
+
+
+def _state_sums(df, columns, start, end):
+    rows = _rows(df, start, end)
+    if start is not None or end is not None:
+        # As the time index: undated rows fall outside every window
+        rows = rows.filter(pl.col('date').is_not_null())
+    return rows.filter(pl.col('state').is_not_null()).group_by('state').agg(_sums(columns)).sort('state')
+
+
+def get_age_distribution_by_state(df, start=None, end=None):
+    age_dist = _state_sums(df, AGE_COLUMNS, start, end).unpivot(
+        index='state', on=AGE_COLUMNS, variable_name='age_group', value_name='enrollments'
+    )
+    return age_dist.collect().to_pandas()
+
+
+def calculate_adult_enrollment_by_state(df, start=None, end=None):
+    adult_stats = _state_sums(df, ['age_18_greater'], start, end).sort(
+        'age_18_greater', descending=True, maintain_order=True
+    )
+    return adult_stats.collect().to_pandas()
+
+
+def get_summary_statistics(df, start=None, end=None, distinct='exact', precision=None):
+    _check_distinct(distinct)
+    rows = _rows(df, start, end)
+    windowed = start is not None or end is not None
+    if windowed:
+        rows = rows.filter(pl.col('date').is_not_null())
+    summary = rows.select(
+        *_sums(SUM_COLUMNS + ['records']),
+        pl.col('date').min().alias('date_min'),
+        pl.col('date').max().alias('date_max'),
+        pl.col('state').drop_nulls().n_unique().alias('num_states'),
+        pl.col('district').drop_nulls().n_unique().alias('num_districts'),
+        pl.col('pincode').drop_nulls().n_unique().alias('num_pincodes'),
+    ).collect().row(0, named=True)
+
+    total_enrollments = summary['total_enrollments']
+    date_min, date_max = pd.Timestamp(summary['date_min']), pd.Timestamp(summary['date_max'])
+    date_range_days = 0 if pd.isna(date_min) else (date_max - date_min).days
+    avg_daily = total_enrollments / date_range_days if date_range_days > 0 else 0
+    return {
+        'total_enrollments': int(total_enrollments),
+        'age_0_5': int(summary['age_0_5']),
+        'age_5_17': int(summary['age_5_17']),
+        'age_18_greater': int(summary['age_18_greater']),
+        'date_range': None if pd.isna(date_min) else f"{date_min.date()} to {date_max.date()}",
+        'date_range_days': date_range_days,
+        'avg_daily_enrollments': int(avg_daily),
+        'num_states': summary['num_states'],
+        'num_districts': summary['num_districts'],
+        'num_pincodes': summary['num_pincodes'],
+        'num_records': int(summary['records']),
+    }
+
+
+def get_top_pincodes(df, top_n=50, workers=None):
+    pincode_stats = _rows(df).filter(
+        pl.col('state').is_not_null() & pl.col('district').is_not_null() & pl.col('pincode').is_not_null()
+    ).group_by('state', 'district', 'pincode').agg(
+        *_sums(['total_enrollments'] + AGE_COLUMNS)
+    )
+    return _ranked(pincode_stats, 'total_enrollments', ['state', 'district', 'pincode'], top_n).collect().to_pandas()
@@ -0,0 +1,139 @@
+"""
+Background Data Refresh
+
+A `DataRefresher` owns the loaded data of the newest data version. A daemon
+thread polls the version (a few stat calls, see versions.py) and, when the
+data changes, loads and warms the new version off the request path, then
+swaps it in with a single reference assignment. Readers pin one `Loaded`
+(version, data) pair per request, so a refresh never mixes two versions
+within a request, and the previous version stays alive until its last
+reader lets go.
+
+    refresher = DataRefresher(load).start()   # load() -> (version, data)
+    loaded = refresher.current()    # waits only while nothing is loaded yet
+    loaded.version, loaded.data
+    refresher.status()              # version, refresh latency, refresh in progress, errors
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+
+from versions import current_version
+
+REFRESH_SECONDS_ENV = "UIDAI_REFRESH_SECONDS"
+DEFAULT_REFRESH_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+Loaded = namedtuple('Loaded', ['version', 'data', 'loaded_at', 'seconds'])
+
+
+class DataRefresher:
+    """
+    Keeps the current data version loaded, calling `load()` in a background
+    thread every time `version_of()` changes. `load` returns the version of
+    what it actually loaded along with the data, since the data may change
+    again while it loads. `on_swap` is called with each newly swapped-in
+    Loaded.
+    """
+
+    def __init__(self, load, version_of=current_version, interval=None, on_swap=None):
+        self.interval = interval or float(os.environ.get(REFRESH_SECONDS_ENV, DEFAULT_REFRESH_SECONDS))
+        self._load = load
+        self._version_of = version_of
+        self._on_swap = on_swap
+        self._loaded = None
+        # One refresh at a time, whether polled or asked for by a reader
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshing = None
+        self.last_error = None
+        self.history = deque(maxlen=20)
+
+    def start(self):
+        """Starts the polling thread (once); returns the refresher"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="data-refresher", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval)
+
+    def refresh(self):
+        """Loads and swaps in the current data version unless it is loaded already; returns the Loaded in use"""
+        with self._refresh_lock:
+            try:
+                version = self._version_of()
+            except OSError as exc:
+                # e.g. the CSV is missing for a moment while it is being replaced
+                logger.warning("Could not read the data version: %s", exc)
+                return self._loaded
+            if self._loaded is not None and self._loaded.version == version:
+                return self._loaded
+
+            self.refreshing = version
+            began = time.perf_counter()
+            try:
+                version, data = self._load()
+            except Exception as exc:
+                # Keep serving the previous version; the next poll retries
+                logger.exception("Refresh to %s failed", version)
+                self.last_error = f"{version}: {exc!r}"
+                self.history.append(self._record(version, began, error=repr(exc)))
+                return self._loaded
+            finally:
+                self.refreshing = None
+
+            seconds = time.perf_counter() - began
+            self._loaded = Loaded(version, data, datetime.now(timezone.utc), seconds)
+            self.last_error = None
+            self.history.append(self._record(version, began))
+            logger.info("Swapped in data version %s (loaded in %.2fs)", version, seconds)
+            if self._on_swap is not None:
+                self._on_swap(self._loaded)
+            return self._loaded
+
+    @staticmethod
+    def _record(version, began, error=None):
+        return {
+            'version': version,
+            'at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - began, 3),
+            'error': error,
+        }
+
+    def current(self, wait=True):
+        """
+        The Loaded in use. Until a first version has loaded, waits for it
+        (or loads it inline) with `wait`, else returns None.
+        """
+        loaded = self._loaded
+        if loaded is None and wait:
+            loaded = self.refresh()
+            if loaded is None:
+                raise RuntimeError(f"No data version could be loaded: {self.last_error}")
+        return loaded
+
+    def status(self):
+        loaded = self._loaded
+        return {
+            'version': loaded.version if loaded else None,
+            'loaded_at': loaded.loaded_at.isoformat(timespec='seconds') if loaded else None,
+            'seconds': round(loaded.seconds, 3) if loaded else None,
+            'refreshing': self.refreshing,
+            'last_error': self.last_error,
+            'history': list(self.history),
+        }
@@ -0,0 +1,148 @@
+"""
+Memory-mapped Shared Cube
+
+Each dashboard worker process otherwise holds its own copy of the cube. A
+shared snapshot writes the cube's base and roll-ups once as fixed-width
+`.npy` arrays (count columns, dates, and categorical codes, with the
+category labels in the manifest), which every worker then opens with
+`mmap_mode='r'`. The frames are built on top of the mapped arrays without
+copying, so attaching takes milliseconds and the pages live once in the OS
+page cache however many workers read them.
+
+    data/.shared/<version>/manifest.json
+    data/.shared/<version>/<frame>.<column>.npy
+
+Snapshots are written to a temporary directory and renamed into place, so
+a worker sees either a whole snapshot or none.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from cube import SUM_COLUMNS, EnrollmentCube
+from instrumentation import instrumented
+from sketch import SketchTable
+
+SHARED_DIR = "data/.shared"
+SNAPSHOT_FORMAT = 1
+
+FRAMES = ['base', 'pincode', 'district', 'state', 'daily', 'monthly']
+
+
+def _snapshot_dir(version, shared_dir):
+    return os.path.join(shared_dir, str(version))
+
+
+def _write_columns(frame, name, out_dir):
+    """Writes each column as one .npy array and returns the column specs"""
+    columns = []
+    for col in frame.columns:
+        values = frame[col]
+        spec = {'name': col}
+        if not isinstance(values.dtype, pd.CategoricalDtype) and values.dtype.kind not in 'biufM':
+            # Strings are stored as codes like categoricals
+            values = values.astype('category')
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            spec['categories'] = values.cat.categories.tolist()
+            array = values.cat.codes.to_numpy()
+        else:
+            array = values.to_numpy()
+        np.save(os.path.join(out_dir, f"{name}.{col}.npy"), array, allow_pickle=False)
+        columns.append(spec)
+    return columns
+
+
+def _attach_columns(columns, name, snapshot):
+    """The frame of one snapshot entry, backed by read-only memory maps"""
+    data = {}
+    for spec in columns:
+        array = np.load(os.path.join(snapshot, f"{name}.{spec['name']}.npy"), mmap_mode='r')
+        if 'categories' in spec:
+            dtype = pd.CategoricalDtype(pd.Index(spec['categories']))
+            data[spec['name']] = pd.Categorical.from_codes(array, dtype=dtype, validate=False)
+        else:
+            data[spec['name']] = array
+    return pd.DataFrame(data, copy=False)
+
+
+def export_shared(cube, shared_dir=SHARED_DIR):
+    """
+    Writes a snapshot of `cube` (base, roll-ups and any built sketches) under
+    its version and removes snapshots of other versions. Returns its path.
+    """
+    if cube.version is None:
+        raise ValueError("Only a versioned cube can be shared")
+    os.makedirs(shared_dir, exist_ok=True)
+    target = _snapshot_dir(cube.version, shared_dir)
+    if os.path.exists(os.path.join(target, "manifest.json")):
+        return target
+
+    # Build the region index first: it may re-sort the base, and a base
+    # exported in region order is never copied by the attached workers
+    cube.regions
+    tmp_dir = tempfile.mkdtemp(dir=shared_dir, prefix=".tmp-")
+    try:
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': cube.version,
+            'sums': {col: int(value) for col, value in cube.sums.items()},
+            'frames': {name: _write_columns(getattr(cube, name), name, tmp_dir) for name in FRAMES},
+            'sketches': {},
+        }
+        for precision, table in cube._sketches.items():
+            name = f"sketches-p{precision}"
+            manifest['sketches'][precision] = _write_columns(table.keys, name, tmp_dir)
+            np.save(os.path.join(tmp_dir, f"{name}.registers.npy"), table.registers, allow_pickle=False)
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_dir, target)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # Another worker published the same version first
+        if not os.path.exists(os.path.join(target, "manifest.json")):
+            raise
+
+    for name in os.listdir(shared_dir):
+        if name != str(cube.version) and not name.startswith(".tmp-"):
+            shutil.rmtree(os.path.join(shared_dir, name), ignore_errors=True)
+    return target
+
+
+@instrumented
+def attach_shared(version, shared_dir=SHARED_DIR):
+    """
+    The cube of `version` backed by the shared snapshot, or None if there is
+    no snapshot of that version.
+    """
+    snapshot = _snapshot_dir(version, shared_dir)
+    try:
+        with open(os.path.join(snapshot, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+
+    frames = {name: _attach_columns(columns, name, snapshot) for name, columns in manifest['frames'].items()}
+    cube = EnrollmentCube(frames.pop('base'), version=manifest['version'])
+    # Seed the roll-ups so nothing is recomputed
+    cube.__dict__.update(frames)
+    cube.__dict__['sums'] = pd.Series(manifest['sums'])[SUM_COLUMNS]
+    for precision, columns in manifest['sketches'].items():
+        name = f"sketches-p{precision}"
+        registers = np.load(os.path.join(snapshot, f"{name}.registers.npy"), mmap_mode='r')
+        keys = _attach_columns(columns, name, snapshot)
+        cube._sketches[int(precision)] = SketchTable(keys, registers, int(precision))
+    return cube
+
+
+if __name__ == '__main__':
+    from store import load_current_cube
+
+    cube = load_current_cube()
+    print(f"Shared snapshot of {cube.version} at {export_shared(cube)}")
@@ -0,0 +1,193 @@
+"""
+Mergeable Distinct-count Sketches
+
+HyperLogLog in numpy, for approximate distinct counts of districts and
+pincodes that can be unioned across states, months and appended files
+(exact `nunique` results cannot be combined without the underlying keys).
+
+A sketch is a row of 2^precision registers; the union of sketches is their
+element-wise maximum, so many sketches are held as one 2-D uint8 array.
+The relative standard error is about 1.04 / sqrt(2^precision): 3.3% at
+precision 10, 1.6% at 12, 0.8% at 14.
+
+`SketchTable` keeps one pincode sketch per (state, district, year, month) of
+the enrolment data, which is the grain stored alongside the aggregates.
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PRECISION = 12
+MIN_PRECISION, MAX_PRECISION = 4, 18
+
+SKETCH_KEYS = ['state', 'district', 'year', 'month']
+
+
+def _check_precision(precision):
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {precision}")
+
+
+def hash_values(values):
+    """
+    64-bit hashes of `values` (NaN-like values get no hash and are dropped).
+
+    Values are hashed once per distinct value; numbers are hashed as int64
+    so 110001 and 110001.0 agree across files read with different dtypes.
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Index(uniques)
+    if pd.api.types.is_numeric_dtype(uniques.dtype):
+        uniques = uniques.astype('int64')
+    else:
+        uniques = uniques.astype(str)
+    hashed = pd.util.hash_array(np.asarray(uniques))
+    return hashed[codes[codes >= 0]], codes >= 0
+
+
+def _bit_length(values):
+    """Bit length of each uint64, exact (float64 is exact on 32-bit halves)"""
+    high = (values >> np.uint64(32)).astype('float64')
+    low = (values & np.uint64(0xFFFFFFFF)).astype('float64')
+    with np.errstate(divide='ignore'):
+        high_bits = np.where(high > 0, np.floor(np.log2(high)) + 33, 0)
+        low_bits = np.where(low > 0, np.floor(np.log2(low)) + 1, 0)
+    return np.where(high > 0, high_bits, low_bits).astype('int64')
+
+
+def register_updates(hashes, precision):
+    """(register index, rank) of each hash"""
+    shift = np.uint64(64 - precision)
+    index = (hashes >> shift).astype('int64')
+    rest = hashes << np.uint64(precision)
+    # Rank = leading zeros of the remaining bits + 1, capped when all are zero
+    rank = np.minimum(64 - _bit_length(rest) + 1, 64 - precision + 1)
+    return index, rank.astype('uint8')
+
+
+def build_registers(groups, num_groups, hashes, precision):
+    """Registers of shape (num_groups, 2^precision) from hashes labelled by group"""
+    _check_precision(precision)
+    registers = np.zeros((num_groups, 1 << precision), dtype='uint8')
+    index, rank = register_updates(hashes, precision)
+    np.maximum.at(registers, (groups, index), rank)
+    return registers
+
+
+def estimate(registers):
+    """Distinct-count estimate of each row of registers"""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.exp2(-registers.astype('float64')).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    # Linear counting is more accurate while many registers are still empty
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+
+def _groups(labels):
+    """Group number of each row of the `labels` frame, and the sorted group keys"""
+    grouped = labels.groupby(list(labels.columns), observed=True, dropna=False)
+    return grouped.ngroup().to_numpy(), grouped.size().reset_index()[list(labels.columns)]
+
+
+def union_by(registers, labels):
+    """Unions the rows of `registers` with equal `labels` rows; returns (keys frame, registers)"""
+    groups, keys = _groups(labels)
+    if not len(groups):
+        return keys, registers[:0]
+    order = np.argsort(groups, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(groups[order]) != 0])
+    return keys, np.maximum.reduceat(registers[order], starts, axis=0)
+
+
+class SketchTable:
+    """
+    Pincode sketches per (state, district, year, month).
+
+    Districts are counted from the table's own keys (a district sketch is
+    the union of its rows, a state's district count hashes the district
+    names of its rows), so one table answers both distinct counts for any
+    set of states and months and merges with tables of other files.
+    """
+
+    def __init__(self, keys, registers, precision):
+        self.keys = keys.reset_index(drop=True)
+        self.registers = registers
+        self.precision = precision
+
+    @classmethod
+    def from_frame(cls, frame, precision=DEFAULT_PRECISION):
+        """Sketches enrolment rows (raw rows or a cube base) with a datetime `date`"""
+        _check_precision(precision)
+        frame = frame.assign(year=frame['date'].dt.year, month=frame['date'].dt.month)
+        # One row per key and pincode before hashing
+        distinct = frame.groupby(SKETCH_KEYS + ['pincode'], observed=True).size().reset_index()[
+            SKETCH_KEYS + ['pincode']
+        ]
+        groups, keys = _groups(distinct[SKETCH_KEYS])
+        hashes, hashed = hash_values(distinct['pincode'].to_numpy())
+        registers = build_registers(groups[hashed], len(keys), hashes, precision)
+        return cls(keys.astype({'year': 'int64', 'month': 'int64'}), registers, precision)
+
+    def merge(self, other):
+        """Union of two tables (e.g. the history and an appended file)"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        keys = pd.concat([self.keys, other.keys], ignore_index=True)
+        registers = np.concatenate([self.registers, other.registers])
+        keys, registers = union_by(registers, keys.astype({'state': str, 'district': str}))
+        return SketchTable(keys, registers, self.precision)
+
+    def select(self, start=None, end=None):
+        """Rows of the months overlapping the inclusive [start, end] window"""
+        period = self.keys['year'] * 12 + self.keys['month']
+        mask = np.ones(len(self.keys), dtype=bool)
+        if start is not None:
+            start = pd.Timestamp(start)
+            mask &= period.to_numpy() >= start.year * 12 + start.month
+        if end is not None:
+            end = pd.Timestamp(end)
+            mask &= period.to_numpy() <= end.year * 12 + end.month
+        return SketchTable(self.keys[mask], self.registers[mask], self.precision)
+
+    def _district_registers(self, labels):
+        """District-name sketches of the rows grouped by `labels` (a frame)"""
+        groups, keys = _groups(labels)
+        hashes, hashed = hash_values(self.keys['district'].to_numpy())
+        return keys, build_registers(groups[hashed], len(keys), hashes, self.precision)
+
+    def counts(self, level):
+        """
+        Estimated distinct counts: a frame of 'state' or 'district' keys with
+        num_pincodes (and num_districts per state), or for 'national' a dict.
+        """
+        if level == 'national':
+            if not len(self.keys):
+                return {'num_districts': 0, 'num_pincodes': 0}
+            _, districts = self._district_registers(pd.DataFrame({'all': np.zeros(len(self.keys))}))
+            return {
+                'num_districts': int(round(estimate(districts)[0])),
+                'num_pincodes': int(round(estimate(self.registers.max(axis=0))[0])),
+            }
+        keys = ['state'] if level == 'state' else ['state', 'district']
+        result, registers = union_by(self.registers, self.keys[keys])
+        result['num_pincodes'] = np.round(estimate(registers)).astype('int64')
+        if level == 'state':
+            # Same sorted state groups, so the estimates line up row for row
+            _, districts = self._district_registers(self.keys[['state']])
+            result['num_districts'] = np.round(estimate(districts)).astype('int64')
+        return result
+
+    def to_frame(self):
+        """Keys plus one binary `registers` column, for parquet"""
+        frame = self.keys.copy()
+        frame['registers'] = [row.tobytes() for row in self.registers]
+        return frame
+
+    @classmethod
+    def from_stored(cls, frame, precision):
+        registers = np.frombuffer(b''.join(frame['registers']), dtype='uint8').reshape(len(frame), 1 << precision)
+        return cls(frame.drop(columns='registers'), registers.copy(), precision)
@@ -0,0 +1,276 @@
+"""
+Batch Chart Snapshots
+
+Precomputes the summary statistics and the charts of every region ("All"
+and each state) for one data version, fanning the regions out over a
+process pool, and writes them as JSON (for the dashboard and the API) and
+as one HTML report per region (for reports):
+
+    data/.snapshots/<version>/manifest.json
+    data/.snapshots/<version>/index.html
+    data/.snapshots/<version>/<region>/summary.json
+    data/.snapshots/<version>/<region>/<chart>.json      (<chart>.<i>.json for chart pairs)
+    data/.snapshots/<version>/<region>/report.html
+
+Rankings across states are built for "All" only; the per-region charts are
+built for every region. Reading a snapshot needs only the standard library
+(and plotly to turn chart JSON back into figures), so the dashboard and the
+API serve a matching version without loading pandas or the data.
+
+    python snapshots.py [workers]
+"""
+
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timezone
+
+SNAPSHOT_DIR = "data/.snapshots"
+SNAPSHOT_FORMAT = 1
+ALL = "All"
+
+
+def region_slug(region):
+    """File-system safe directory name of a region (the manifest keeps the real name)"""
+    return re.sub(r'[^0-9A-Za-z]+', '_', region).strip('_')
+
+
+def _charts(national):
+    """
+    name -> build(enrol, birth_df, pop_df) of the charts snapshotted for a
+    region; with `national`, the rankings across states as well
+    """
+    import analysis
+
+    charts = {
+        'enrollment_trend': lambda enrol, birth_df, pop_df: analysis.enrollment_trend(enrol),
+        'monthly_velocity': lambda enrol, birth_df, pop_df: analysis.monthly_velocity_chart(enrol),
+        'age_distribution': lambda enrol, birth_df, pop_df: analysis.age_distribution(enrol),
+        'district_leaderboard': lambda enrol, birth_df, pop_df: analysis.district_leaderboard(enrol),
+        'birth_scatter': lambda enrol, birth_df, pop_df: analysis.enrollment_vs_birth_scatter(enrol, birth_df),
+        'rolling_velocity': lambda enrol, birth_df, pop_df: analysis.rolling_velocity_chart(enrol),
+        'district_anomalies': lambda enrol, birth_df, pop_df: analysis.district_anomalies_table(enrol),
+    }
+    if national:
+        charts.update({
+            'coverage_extremes': lambda enrol, birth_df, pop_df: analysis.coverage_extremes_charts(enrol, pop_df, 15),
+            'adult_enrollment': lambda enrol, birth_df, pop_df: analysis.adult_enrollment_by_state_chart(enrol),
+            'age_group_composition': lambda enrol, birth_df, pop_df: analysis.age_group_composition(enrol),
+            'state_performance': lambda enrol, birth_df, pop_df: analysis.state_performance_ranking(enrol),
+            'state_wise_enrollment': lambda enrol, birth_df, pop_df: analysis.state_wise_enrollment(enrol),
+            'coverage_gap': lambda enrol, birth_df, pop_df: analysis.coverage_gap_analysis(enrol, birth_df)[0],
+            'priority_zones': lambda enrol, birth_df, pop_df: analysis.priority_zones_table(enrol, birth_df),
+        })
+    return charts
+
+
+# Set in each pool worker by _init_worker
+_worker = {}
+
+
+def _init_worker(version, shared_dir):
+    from shared_store import attach_shared
+    from store import load_current_cube
+    from utils import load_birth_data, load_population_data
+
+    # The parent published the shared snapshot, so attaching is a few mmaps
+    _worker.update(
+        cube=attach_shared(version, shared_dir) or load_current_cube(shared_dir=shared_dir),
+        birth_df=load_birth_data(),
+        pop_df=load_population_data(),
+    )
+
+
+def _write_value(value, region_dir, name):
+    """Writes a figure, a tuple of figures or a table; returns its manifest entry"""
+    if isinstance(value, tuple):
+        for i, fig in enumerate(value):
+            with open(os.path.join(region_dir, f"{name}.{i}.json"), "w") as f:
+                f.write(fig.to_json())
+        return {'kind': 'figures', 'parts': len(value)}
+    if hasattr(value, 'to_plotly_json'):
+        with open(os.path.join(region_dir, f"{name}.json"), "w") as f:
+            f.write(value.to_json())
+        return {'kind': 'figure'}
+    with open(os.path.join(region_dir, f"{name}.json"), "w") as f:
+        f.write(value.to_json(orient='records'))
+    return {'kind': 'table'}
+
+
+def _report_html(region, stats, values):
+    """One self-contained HTML page with the region's summary and charts"""
+    parts = [
+        f"<html><head><meta charset='utf-8'><title>{html.escape(region)}</title></head><body>",
+        f"<h1>UIDAI 2025 Enrollment Analytics: {html.escape(region)}</h1>",
+        "<table>" + "".join(
+            f"<tr><th>{html.escape(key)}</th><td>{html.escape(str(value))}</td></tr>" for key, value in stats.items()
+        ) + "</table>",
+    ]
+    plotlyjs = 'cdn'
+    for value in values:
+        for item in (value if isinstance(value, tuple) else (value,)):
+            if hasattr(item, 'to_plotly_json'):
+                parts.append(item.to_html(full_html=False, include_plotlyjs=plotlyjs))
+                plotlyjs = False
+            else:
+                parts.append(item.to_html(index=False))
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def _render_region(region, out_dir):
+    """Builds and writes the summary and charts of one region; returns its manifest entry"""
+    from enhanced_metrics import get_summary_statistics
+
+    began = time.perf_counter()
+    cube = _worker['cube']
+    enrol = cube if region == ALL else cube.filter(region)
+    region_dir = os.path.join(out_dir, region_slug(region))
+    os.makedirs(region_dir, exist_ok=True)
+
+    stats = get_summary_statistics(enrol)
+    with open(os.path.join(region_dir, "summary.json"), "w") as f:
+        # Serialized exactly like the API's summary response
+        f.write(json.dumps(stats, default=int))
+
+    charts, values = {}, []
+    for name, build in _charts(region == ALL).items():
+        value = build(enrol, _worker['birth_df'], _worker['pop_df'])
+        charts[name] = _write_value(value, region_dir, name)
+        values.append(value)
+    with open(os.path.join(region_dir, "report.html"), "w") as f:
+        f.write(_report_html(region, stats, values))
+    return region, {
+        'slug': region_slug(region),
+        'charts': charts,
+        'seconds': round(time.perf_counter() - began, 3),
+    }
+
+
+def generate_snapshots(workers=None, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Writes the snapshot of the current data version across a pool of
+    `workers` processes (all CPUs by default) and removes snapshots of
+    other versions. Returns the snapshot's path.
+    """
+    from shared_store import SHARED_DIR, export_shared
+    from store import load_current_cube
+
+    cube = load_current_cube()
+    # Workers attach to the shared copy instead of each loading the data
+    export_shared(cube, SHARED_DIR)
+    regions = [ALL] + sorted(str(state) for state in cube.state['state'].dropna())
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target = os.path.join(snapshot_dir, cube.version)
+    tmp_dir = tempfile.mkdtemp(dir=snapshot_dir, prefix=".tmp-")
+    began = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(cube.version, SHARED_DIR)) as pool:
+            entries = dict(pool.map(_render_region, regions, [tmp_dir] * len(regions)))
+
+        calendar = cube.calendar['date']
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': cube.version,
+            'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - began, 3),
+            'date_range': [calendar.min().date().isoformat(), calendar.max().date().isoformat()],
+            'districts': {
+                region: sorted(str(d) for d in cube.regions.districts(region)) for region in regions[1:]
+            },
+            'regions': entries,
+        }
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        with open(os.path.join(tmp_dir, "index.html"), "w") as f:
+            f.write("<html><body><h1>UIDAI 2025 Enrollment Reports</h1><ul>" + "".join(
+                f"<li><a href='{entry['slug']}/report.html'>{html.escape(region)}</a></li>"
+                for region, entry in entries.items()
+            ) + "</ul></body></html>")
+
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(tmp_dir, target)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    for name in os.listdir(snapshot_dir):
+        if name != cube.version and not name.startswith(".tmp-"):
+            shutil.rmtree(os.path.join(snapshot_dir, name), ignore_errors=True)
+    return target
+
+
+class Snapshot:
+    """Read access to the snapshot of one data version (standard library and plotly only)"""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest['version']
+        self.states = [region for region in manifest['regions'] if region != ALL]
+        self.date_range = tuple(date.fromisoformat(day) for day in manifest['date_range'])
+
+    def districts(self, state):
+        return self.manifest['districts'].get(state, [])
+
+    def has(self, region, name=None):
+        """Whether the snapshot holds `region`, and its chart `name` if given"""
+        entry = self.manifest['regions'].get(region)
+        return entry is not None and (name is None or name in entry['charts'])
+
+    def _read(self, region, filename):
+        with open(os.path.join(self.path, self.manifest['regions'][region]['slug'], filename)) as f:
+            return f.read()
+
+    def summary_json(self, region=ALL):
+        return self._read(region, "summary.json")
+
+    def summary(self, region=ALL):
+        return json.loads(self.summary_json(region))
+
+    def chart_json(self, region, name):
+        """The chart as JSON text: a plotly figure, a list of figures, or a list of table rows"""
+        spec = self.manifest['regions'][region]['charts'][name]
+        if spec['kind'] == 'figures':
+            return "[" + ",".join(self._read(region, f"{name}.{i}.json") for i in range(spec['parts'])) + "]"
+        return self._read(region, f"{name}.json")
+
+    def chart(self, region, name):
+        """The chart as built: a figure, a tuple of figures, or a list of table rows"""
+        import plotly.io as pio
+
+        spec = self.manifest['regions'][region]['charts'][name]
+        if spec['kind'] == 'figure':
+            return pio.from_json(self._read(region, f"{name}.json"))
+        if spec['kind'] == 'figures':
+            return tuple(pio.from_json(self._read(region, f"{name}.{i}.json")) for i in range(spec['parts']))
+        return json.loads(self._read(region, f"{name}.json"))
+
+
+def open_snapshot(version, snapshot_dir=SNAPSHOT_DIR):
+    """The Snapshot of `version`, or None if there is none"""
+    path = os.path.join(snapshot_dir, version)
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != version:
+        return None
+    return Snapshot(path, manifest)
+
+
+if __name__ == '__main__':
+    import sys
+
+    path = generate_snapshots(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    print(f"Snapshot of {manifest['version']}: {len(manifest['regions'])} regions in {manifest['seconds']}s at {path}")
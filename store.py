@@ -0,0 +1,264 @@
+"""
+Persisted Enrollment Aggregates
+
+Keeps the enrolment cube on disk so new daily drops can be merged in without
+re-reading the history. A store directory holds:
+
+- `manifest.json` with the version number, the ingested sources, the files of
+  the current version and the running totals
+- one partial cube base per ingested file (`base-<n>.parquet`)
+- the pincode, district, state, daily and monthly roll-ups of the current
+  version (`<level>-v<version>.parquet`)
+- the distinct-count sketches of the current version (`sketches-v<version>.parquet`,
+  see sketch.py), at the precision recorded in the manifest
+- the roll-ups and sketches of the previous version, kept until the next
+  commit so a reader that read the previous manifest can finish loading
+
+Appending merges the delta's roll-ups and sketches into the persisted ones
+and bumps the version, so refresh cost follows the size of the delta and of the roll-ups
+(the number of distinct keys), never the number of historical rows.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from cube import SUM_COLUMNS, EnrollmentCube, _aggregate, build_enrollment_cube, stream_enrollment_cube
+from instrumentation import instrumented
+from shared_store import SHARED_DIR, attach_shared, export_shared
+from sketch import DEFAULT_PRECISION, SketchTable
+from utils import enforce_enrollment_schema, read_enrollment_csv, read_parquet_frame
+from versions import (
+    ENROLMENT_CSV, STORE_DIR, current_version, manifest_path, read_manifest, source_fingerprint,
+    store_version
+)
+
+logger = logging.getLogger(__name__)
+
+LEVEL_KEYS = {
+    'pincode': ['state', 'district', 'pincode'],
+    'daily': ['date'],
+    'monthly': ['year', 'month'],
+}
+
+
+def _write_frame(df, path):
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def _write_manifest(manifest, store_dir):
+    # The manifest switch is the commit point: readers see either version whole
+    tmp_path = manifest_path(store_dir) + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path(store_dir))
+
+
+def _merge(existing, delta, keys):
+    """Adds a delta roll-up into an existing one on `keys`"""
+    merged = pd.concat([existing, delta], ignore_index=True)
+    return merged.groupby(keys, observed=True)[SUM_COLUMNS].sum().reset_index()
+
+
+def _derive_levels(pincode):
+    """District and state roll-ups (with exact distinct counts) from the pincode level"""
+    return {
+        'district': _aggregate(pincode, ['state', 'district'], {'pincode': 'num_pincodes'}),
+        'state': _aggregate(
+            pincode, ['state'], {'district': 'num_districts', 'pincode': 'num_pincodes'}
+        ),
+    }
+
+
+def _sums_of(cube):
+    return {col: int(value) for col, value in cube.sums.items()}
+
+
+def _ingest(path, store_dir, chunksize, index):
+    """Aggregates one source file and writes its partial base; returns the delta cube"""
+    delta = stream_enrollment_cube(path, chunksize=chunksize)
+    part = f"base-{index:06d}.parquet"
+    _write_frame(delta.base, os.path.join(store_dir, part))
+    return delta, part
+
+
+def _commit(store_dir, manifest, levels, sketches, path, part, delta):
+    """Writes the roll-ups and sketches of the next version and switches the manifest to them"""
+    version = manifest.get('version', 0) + 1
+    files = {}
+    for level, frame in levels.items():
+        if level not in ('daily', 'monthly'):
+            frame = enforce_enrollment_schema(frame)
+        files[level] = f"{level}-v{version}.parquet"
+        _write_frame(frame, os.path.join(store_dir, files[level]))
+    files['sketches'] = f"sketches-v{version}.parquet"
+    _write_frame(sketches.to_frame(), os.path.join(store_dir, files['sketches']))
+
+    # Files of the version before the previous one
+    stale = set(manifest.get('previous_files', {}).values())
+    manifest.update({
+        'version': version,
+        'updated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'files': files,
+        'previous_files': manifest.get('files', {}),
+    })
+    manifest.setdefault('parts', []).append(part)
+    manifest.setdefault('sources', []).append({
+        'path': os.path.abspath(path),
+        'fingerprint': source_fingerprint(path),
+        'records': int(delta.sums['records']),
+    })
+    _write_manifest(manifest, store_dir)
+
+    for name in stale:
+        try:
+            os.remove(os.path.join(store_dir, name))
+        except FileNotFoundError:
+            pass
+    return version
+
+
+def build_store(filepath=ENROLMENT_CSV, store_dir=STORE_DIR, chunksize=500_000,
+                sketch_precision=DEFAULT_PRECISION):
+    """
+    Creates (or replaces) the store from a full enrolment CSV.
+
+    Returns the new version number.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    for name in os.listdir(store_dir):
+        if name.endswith(".parquet") or name == "manifest.json":
+            os.remove(os.path.join(store_dir, name))
+
+    cube, part = _ingest(filepath, store_dir, chunksize, 0)
+    levels = {level: getattr(cube, level) for level in ['pincode', 'daily', 'monthly']}
+    levels.update(_derive_levels(cube.pincode))
+    manifest = {'sums': _sums_of(cube), 'sketch_precision': sketch_precision}
+    return _commit(store_dir, manifest, levels, cube.sketches(sketch_precision), filepath, part, cube)
+
+
+def append_delta(delta_path, store_dir=STORE_DIR, chunksize=500_000):
+    """
+    Merges a new enrolment file into the store and bumps its version.
+
+    Totals, the per-state/district/pincode sums, the daily and monthly series
+    and the distinct district/pincode counts are all updated from the delta's
+    own roll-ups. A file that was already ingested is skipped.
+
+    Returns the (possibly unchanged) version number.
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        return build_store(delta_path, store_dir, chunksize)
+
+    fingerprint = source_fingerprint(delta_path)
+    if any(src['fingerprint'] == fingerprint for src in manifest['sources']):
+        return manifest['version']
+
+    delta, part = _ingest(delta_path, store_dir, chunksize, len(manifest['parts']))
+    current = _load_levels(store_dir, manifest)
+    levels = {
+        level: _merge(current[level], getattr(delta, level), keys)
+        for level, keys in LEVEL_KEYS.items()
+    }
+    # Distinct counts are re-derived from the merged pincode keys, so a pincode
+    # already seen in history is not counted twice
+    levels.update(_derive_levels(levels['pincode']))
+
+    # Sketches union by register maximum, so no history is re-read for them either
+    precision = manifest.setdefault('sketch_precision', DEFAULT_PRECISION)
+    history = _load_sketches(store_dir, manifest)
+    if history is None:
+        # A store written before sketches were kept: sketch its bases once
+        history = load_store(store_dir).sketches(precision)
+    sketches = history.merge(delta.sketches(precision))
+
+    manifest['sums'] = {
+        col: manifest['sums'][col] + value for col, value in _sums_of(delta).items()
+    }
+    return _commit(store_dir, manifest, levels, sketches, delta_path, part, delta)
+
+
+def _load_levels(store_dir, manifest):
+    return {
+        level: read_parquet_frame(os.path.join(store_dir, name))
+        for level, name in manifest['files'].items() if level != 'sketches'
+    }
+
+
+def _load_sketches(store_dir, manifest):
+    """The stored SketchTable, or None for stores written before sketches were kept"""
+    if 'sketches' not in manifest['files']:
+        return None
+    frame = read_parquet_frame(os.path.join(store_dir, manifest['files']['sketches']))
+    return SketchTable.from_stored(frame, manifest['sketch_precision'])
+
+
+@instrumented
+def load_store(store_dir=STORE_DIR):
+    """
+    Opens the store as an EnrollmentCube carrying the store version.
+
+    The roll-ups and totals are read from disk; the partial bases are only
+    read (and stacked) if something needs row-level keys, e.g. a state filter.
+    """
+    manifest = read_manifest(store_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No enrolment store at {store_dir}; run build_store() first")
+
+    def load_base():
+        parts = [read_parquet_frame(os.path.join(store_dir, name)) for name in manifest['parts']]
+        return enforce_enrollment_schema(pd.concat(parts, ignore_index=True))
+
+    cube = EnrollmentCube(version=manifest['version'], load_base=load_base)
+    # Seed the cached roll-ups so nothing is recomputed from the base
+    cube.__dict__.update(_load_levels(store_dir, manifest))
+    cube.__dict__['sums'] = pd.Series(manifest['sums'])[SUM_COLUMNS]
+    sketches = _load_sketches(store_dir, manifest)
+    if sketches is not None:
+        cube._sketches[manifest['sketch_precision']] = sketches
+    return cube
+
+
+def load_current_cube(filepath=ENROLMENT_CSV, store_dir=STORE_DIR, shared_dir=SHARED_DIR):
+    """
+    Attaches to the shared memory-mapped snapshot of the current version if
+    another worker already published one; otherwise opens the store if there
+    is one, else builds the cube from the CSV, and publishes the snapshot.
+    """
+    cube = attach_shared(current_version(filepath, store_dir), shared_dir)
+    if cube is not None:
+        return cube
+
+    if store_version(store_dir):
+        cube = load_store(store_dir)
+        cube.version = f"store-v{cube.version}"
+    else:
+        # Fingerprint first: a CSV replaced mid-read shows up as a new version
+        version = f"csv-{source_fingerprint(filepath)}"
+        cube = build_enrollment_cube(read_enrollment_csv(filepath))
+        cube.version = version
+
+    try:
+        export_shared(cube, shared_dir)
+    except OSError as exc:
+        # Sharing is an optimization; a read-only data directory must not break loading
+        logger.warning("Could not publish shared snapshot of %s: %s", cube.version, exc)
+        return cube
+    # Drop this process's private copy in favour of the shared pages
+    return attach_shared(cube.version, shared_dir) or cube
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1:
+        for path in sys.argv[1:]:
+            print(f"Appending {path}... version {append_delta(path)}")
+    else:
+        print(f"Building store from {ENROLMENT_CSV}... version {build_store()}")
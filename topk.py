@@ -0,0 +1,100 @@
+"""
+Streaming Top-k / Bottom-k
+
+Leaderboards only ever show the first or last few rows of an aggregate, so
+instead of sorting the whole aggregate `TopK` keeps a bounded buffer of the
+best (and worst) k rows seen so far. Each pushed batch is cut down with an
+O(n) partition to the rows that can still make the board, and only those are
+merged into the buffer, so a pass costs O(n log k) with O(k) extra memory.
+
+Batches can be a whole aggregate, successive chunks of one, or the partial
+results of key-disjoint partitions. Ties on the ranked value are broken by the
+key columns in ascending order, so the result does not depend on batch order.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TopK:
+    """Bounded top-k and bottom-k of `column` over pushed batches, in one pass"""
+
+    def __init__(self, k, column, keys, largest=True, smallest=True):
+        self.k = k
+        self.column = column
+        self.keys = list(keys)
+        self._top = None if largest else False
+        self._bottom = None if smallest else False
+
+    def _candidates(self, frame, held, descending):
+        """Rows of `frame` that can still enter a board currently holding `held`"""
+        values = frame[self.column].to_numpy(dtype='float64')
+        mask = ~np.isnan(values)
+        valid = values[mask]
+        if len(valid) > self.k:
+            # k-th best value of the batch; ties with it stay in
+            if descending:
+                cut = np.partition(valid, len(valid) - self.k)[len(valid) - self.k]
+                mask &= values >= cut
+            else:
+                cut = np.partition(valid, self.k - 1)[self.k - 1]
+                mask &= values <= cut
+        if held is not None and len(held) == self.k:
+            edge = held[self.column].iloc[-1]
+            mask &= (values >= edge) if descending else (values <= edge)
+        return frame[mask]
+
+    def _merge(self, held, candidates, descending):
+        if held is not None:
+            candidates = pd.concat([held, candidates])
+        ranked = candidates.sort_values(
+            [self.column] + self.keys,
+            ascending=[not descending] + [True] * len(self.keys),
+            kind='stable'
+        )
+        return ranked.head(self.k)
+
+    def push(self, frame):
+        """Folds one batch of aggregate rows into both boards"""
+        if self._top is not False:
+            self._top = self._merge(self._top, self._candidates(frame, self._top, True), True)
+        if self._bottom is not False:
+            self._bottom = self._merge(self._bottom, self._candidates(frame, self._bottom, False), False)
+        return self
+
+    def top(self):
+        """The k largest rows, largest first"""
+        return self._top
+
+    def bottom(self):
+        """The k smallest rows, smallest first"""
+        return self._bottom
+
+
+def _batches(data, batch_size):
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, max(len(data), 1), batch_size):
+            yield data.iloc[start:start + batch_size]
+    else:
+        yield from data
+
+
+def top_k(data, column, k, keys, batch_size=1_000_000):
+    """
+    The `k` rows of `data` with the largest `column`, largest first.
+
+    `data` is a frame or an iterable of key-disjoint frames (e.g. the
+    partial aggregates of partitions).
+    """
+    board = TopK(k, column, keys, smallest=False)
+    for batch in _batches(data, batch_size):
+        board.push(batch)
+    return board.top()
+
+
+def top_bottom_k(data, column, k, keys, batch_size=1_000_000):
+    """Both ends of `data` ranked by `column` in one pass: (largest first, smallest first)"""
+    board = TopK(k, column, keys)
+    for batch in _batches(data, batch_size):
+        board.push(batch)
+    return board.top(), board.bottom()
@@ -1,25 +1,208 @@
+import glob
+import hashlib
+import logging
+import os
+
+import numpy as np
 import pandas as pd
 
+from instrumentation import instrumented
+from versions import ENROLMENT_CSV, source_fingerprint
+
+AGE_COLUMNS = ['age_0_5', 'age_5_17', 'age_18_greater']
+COUNT_COLUMNS = AGE_COLUMNS + ['total_enrollments']
+CATEGORY_COLUMNS = ['state', 'district', 'pincode', 'month_name']
+
+# Bump when the prepared frame changes shape so existing caches are rebuilt
+CACHE_SCHEMA_VERSION = 3
+
+# Canonical state / UT names, as spelled in the birth and population data
+CANONICAL_STATES = [
+    "Andhra Pradesh", "Arunachal Pradesh", "Assam", "Bihar",
+    "Chhattisgarh", "Goa", "Gujarat", "Haryana",
+    "Himachal Pradesh", "Jharkhand", "Karnataka", "Kerala",
+    "Madhya Pradesh", "Maharashtra", "Manipur", "Meghalaya",
+    "Mizoram", "Nagaland", "Odisha", "Punjab",
+    "Rajasthan", "Sikkim", "Tamil Nadu", "Telangana",
+    "Tripura", "Uttar Pradesh", "Uttarakhand", "West Bengal",
+    "Andaman and Nicobar Islands", "Chandigarh",
+    "Dadra and Nagar Haveli and Daman and Diu", "Delhi",
+    "Jammu and Kashmir", "Ladakh", "Lakshadweep", "Puducherry"
+]
+
+# Known alternative spellings, matched case-insensitively
+STATE_ALIASES = {
+    "Andaman & Nicobar Islands": "Andaman and Nicobar Islands",
+    "Pondicherry": "Puducherry",
+    "Nct Delhi": "Delhi",
+    "NCT of Delhi": "Delhi",
+    "Orissa": "Odisha",
+    "Uttaranchal": "Uttarakhand",
+    "Jammu & Kashmir": "Jammu and Kashmir",
+    "Dadra & Nagar Haveli and Daman & Diu": "Dadra and Nagar Haveli and Daman and Diu",
+}
+
+_STATE_REGISTRY = {name.lower(): name for name in CANONICAL_STATES}
+_STATE_REGISTRY.update({alias.lower(): name for alias, name in STATE_ALIASES.items()})
+
+logger = logging.getLogger(__name__)
+
+
+def build_calendar(dates):
+    """
+    Calendar dimension for a set of dates: one row per distinct date with its
+    integer `date_key` (yyyymmdd), year, month, month_name, ISO week and
+    day_of_week, sorted by date.
+    """
+    dates = pd.DatetimeIndex(pd.unique(pd.Series(dates).dropna())).sort_values()
+    calendar = pd.DataFrame({
+        'date': dates,
+        'date_key': (dates.year * 10000 + dates.month * 100 + dates.day).astype('int32'),
+        'year': dates.year.astype('int16'),
+        'month': dates.month.astype('int8'),
+        'month_name': dates.strftime('%B'),
+        'week': dates.isocalendar().week.to_numpy().astype('int8'),
+        'day_of_week': dates.day_name(),
+    })
+    return calendar
+
+
+def _factorize_dates(values):
+    """Parses only the distinct date strings; returns row codes and the parsed uniques"""
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(pd.Series(uniques, dtype=object), format="%d-%m-%Y", errors='coerce')
+    return codes, pd.DatetimeIndex(parsed)
+
+
+def parse_dates(values):
+    """Vectorized dd-mm-YYYY parse that converts each distinct string once"""
+    codes, parsed = _factorize_dates(values)
+    # Missing strings factorize to -1, which picks the trailing NaT
+    lookup = np.append(parsed.to_numpy(), np.datetime64('NaT'))
+    return pd.Series(lookup[codes], index=values.index, name=values.name)
+
+
+def prepare_enrollment_keys(df):
+    """Parse dates and canonicalize states in place"""
+    df['state'] = canonicalize_states(df['state'])
+    df['date'] = parse_dates(df['date'])
+    return df
+
+
+def _prepare_enrollment_frame(df):
+    """Parse dates, canonicalize states and add the derived temporal and total columns"""
+    df['state'] = canonicalize_states(df['state'])
+
+    # Derive the calendar for the few hundred distinct dates and broadcast it
+    # to the rows through their factorized codes
+    codes, parsed = _factorize_dates(df['date'])
+    calendar = build_calendar(parsed).set_index('date')
+    positions = calendar.index.get_indexer(parsed)
+    if (codes == -1).any() or (positions == -1).any():
+        # Unparseable or missing dates: route them to an all-missing row
+        calendar = pd.concat([calendar, calendar.iloc[:0].reindex([pd.NaT])])
+        positions = np.where(positions == -1, len(calendar) - 1, positions)
+        codes = np.where(codes == -1, len(parsed), codes)
+        positions = np.append(positions, len(calendar) - 1)
+    rows = positions[codes]
+
+    df['date'] = calendar.index[rows]
+    for col in ['date_key', 'year', 'month', 'month_name', 'week']:
+        df[col] = calendar[col].to_numpy()[rows]
+    df['total_enrollments'] = df['age_0_5'] + df['age_5_17'] + df['age_18_greater']
+    return enforce_enrollment_schema(df)
+
+
+def enforce_enrollment_schema(df):
+    """
+    Compacts the enrolment frame in place: region keys become categoricals
+    (grouping then runs on integer codes) and counts are downcast to the
+    narrowest signed integer type that holds them. Logs the memory saved.
+    """
+    before = df.memory_usage(deep=True).sum()
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+
+    # Signed types keep differences between counts safe from wrap-around
+    for col in COUNT_COLUMNS + ['year', 'month', 'week']:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]) and not df[col].isna().any():
+            df[col] = pd.to_numeric(df[col].astype('int64'), downcast='integer')
+
+    after = df.memory_usage(deep=True).sum()
+    logger.info(
+        "Enrolment frame compacted: %.1f MB -> %.1f MB (%.1f MB saved)",
+        before / 1e6, after / 1e6, (before - after) / 1e6
+    )
+    return df
+
+
+def read_parquet_frame(path):
+    """Reads a parquet frame written by this package, restoring categorical keys"""
+    df = pd.read_parquet(path)
+    # Integer categoricals (pincode) come back as plain integers
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def _write_cache(df, cache_path):
+    """Atomically write the parquet cache and drop stale copies of the same source"""
+    cache_dir = os.path.dirname(cache_path)
+    stem = os.path.basename(cache_path).rsplit('-', 1)[0]
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+    except (ImportError, OSError):
+        # No parquet engine or read-only data dir: serve uncached
+        return
+    for stale in glob.glob(os.path.join(cache_dir, f"{stem}-*.parquet")):
+        if stale != cache_path:
+            os.remove(stale)
+
+
+@instrumented
+def read_enrollment_csv(filepath=ENROLMENT_CSV, use_cache=True):
+    """
+    Reads the enrolment CSV with parsed dates and derived columns.
+
+    The prepared frame is cached as parquet in a `.cache` folder next to
+    the CSV. The cache file name carries the source fingerprint, so any
+    change to the CSV's size or mtime triggers a rebuild on the next load.
+    """
+    if not use_cache:
+        return _prepare_enrollment_frame(pd.read_csv(filepath))
+
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    cache_key = hashlib.sha1(
+        f"{source_fingerprint(filepath)}|{CACHE_SCHEMA_VERSION}".encode()
+    ).hexdigest()[:16]
+    cache_path = os.path.join(os.path.dirname(filepath), ".cache", f"{stem}-{cache_key}.parquet")
+    if os.path.exists(cache_path):
+        try:
+            return read_parquet_frame(cache_path)
+        except (ImportError, OSError, ValueError):
+            pass
+
+    df = _prepare_enrollment_frame(pd.read_csv(filepath))
+    _write_cache(df, cache_path)
+    return df
+
+
+@instrumented
 def load_data():
-    enrol = pd.read_csv("data/enrolment_merged_cleaned.csv")
-    enrol['date'] = pd.to_datetime(enrol['date'], format="%d-%m-%Y", errors='coerce')
+    enrol = read_enrollment_csv(ENROLMENT_CSV)
     return enrol, None, None
 
+@instrumented
 def load_birth_data():
     # Keep the existing birth data logic but also add a way to load population data
     data = {
-        "state": [
-            "Andhra Pradesh", "Arunachal Pradesh", "Assam", "Bihar",
-            "Chhattisgarh", "Goa", "Gujarat", "Haryana",
-            "Himachal Pradesh", "Jharkhand", "Karnataka", "Kerala",
-            "Madhya Pradesh", "Maharashtra", "Manipur", "Meghalaya",
-            "Mizoram", "Nagaland", "Odisha", "Punjab",
-            "Rajasthan", "Sikkim", "Tamil Nadu", "Telangana",
-            "Tripura", "Uttar Pradesh", "Uttarakhand", "West Bengal",
-            "Andaman and Nicobar Islands", "Chandigarh",
-            "Dadra and Nagar Haveli and Daman and Diu", "Delhi",
-            "Jammu and Kashmir", "Ladakh", "Lakshadweep", "Puducherry"
-        ],
+        "state": CANONICAL_STATES,
         "total_births": [
             750000, 45000, 1000000, 3070000, 800000, 35000, 1180000, 600000,
             90000, 970000, 1040000, 440000, 1990000, 1920000, 50000, 70000,
@@ -30,38 +213,47 @@ def load_birth_data():
     }
     return pd.DataFrame(data)
 
+@instrumented
 def load_population_data():
-    """Loads the state-wise population data"""
+    """Loads the state-wise population data with canonical state names"""
     df = pd.read_csv("data/state_population.csv")
-    return df
+    return normalize_state_names(df)
+
+
+def canonical_state_name(name):
+    """Canonical spelling of a single raw state name"""
+    name = " ".join(str(name).split())
+    # Unknown names fall back to title case, matching the historical cleanup
+    return _STATE_REGISTRY.get(name.lower(), name.title())
+
+
+def canonicalize_states(values):
+    """
+    Maps raw state values to a categorical of canonical names.
+
+    Only the distinct raw values are looked up in the registry; the row-level
+    result is a broadcast of their integer codes, so the cost is independent
+    of the number of rows.
+    """
+    codes, uniques = pd.factorize(values)
+    canonical = [canonical_state_name(value) for value in uniques]
+    categories = sorted(set(canonical))
+    position = {name: i for i, name in enumerate(categories)}
+    # Extra trailing slot keeps missing values (code -1) missing
+    lookup = np.array([position[name] for name in canonical] + [-1], dtype='int32')
+    return pd.Categorical.from_codes(lookup[codes], categories=categories)
 
 
 def normalize_state_names(df):
     """
-    Ensures state names are leading/trailing whitespace free and 
-    consistent with the govt birth data mapping.
+    Ensures the state column uses the canonical names of the govt
+    birth/population data. Only needed for frames that did not go
+    through the enrolment ingest, which canonicalizes once on load.
     """
     # Standardize column name to lowercase 'state'
     if 'State' in df.columns:
         df.rename(columns={'State': 'state'}, inplace=True)
 
-    mapping = {
-        "Andaman & Nicobar Islands": "Andaman and Nicobar Islands",
-        "Pondicherry": "Puducherry",
-        "Nct Delhi": "Delhi",
-        "NCT Delhi": "Delhi"
-    }
-
     if 'state' in df.columns:
-        df['state'] = df['state'].str.strip()
-        df['state'] = df['state'].replace(mapping)
-        # Handle title case but keep specific UT names correct
-        df['state'] = df['state'].str.title()
-        
-        # Consistent mapping back to the standard names used in the birth/pop data
-        final_mapping = {
-            "Andaman And Nicobar Islands": "Andaman and Nicobar Islands",
-            "Dadra And Nagar Haveli And Daman And Diu": "Dadra and Nagar Haveli and Daman and Diu"
-        }
-        df['state'] = df['state'].replace(final_mapping)
+        df['state'] = canonicalize_states(df['state'])
     return df
@@ -0,0 +1,72 @@
+"""
+Data Versions and the First-paint Summary
+
+Standard library only, so the dashboard can tell which data version it is
+about to serve, and draw the header metrics from the small summary file of
+that version, before pandas, plotly or any dataset is loaded.
+"""
+
+import hashlib
+import json
+import os
+
+ENROLMENT_CSV = "data/enrolment_merged_cleaned.csv"
+STORE_DIR = "data/.store"
+SUMMARY_PATH = "data/.cache/summary.json"
+
+
+def source_fingerprint(filepath):
+    """Short hash of a source file's resolved path, size and mtime"""
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def manifest_path(store_dir):
+    return os.path.join(store_dir, "manifest.json")
+
+
+def read_manifest(store_dir=STORE_DIR):
+    """Returns the store manifest, or None if no store exists yet"""
+    try:
+        with open(manifest_path(store_dir)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def store_version(store_dir=STORE_DIR):
+    """Current data version of the store (0 when it does not exist)"""
+    manifest = read_manifest(store_dir)
+    return manifest['version'] if manifest else 0
+
+
+def current_version(filepath=ENROLMENT_CSV, store_dir=STORE_DIR):
+    """
+    Version string of the data the dashboard would load right now: the
+    store version when a store exists, otherwise the CSV's fingerprint.
+    Cheap enough to check on every request.
+    """
+    version = store_version(store_dir)
+    if version:
+        return f"store-v{version}"
+    return f"csv-{source_fingerprint(filepath)}"
+
+
+def read_summary(version, path=SUMMARY_PATH):
+    """The summary statistics saved for `version`, or None if there are none"""
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return saved['stats'] if saved.get('version') == version else None
+
+
+def write_summary(version, stats, path=SUMMARY_PATH):
+    """Saves the full-period summary statistics of `version` for the next first paint"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({'version': version, 'stats': stats}, f, indent=2, default=int)
+    os.replace(tmp_path, path)